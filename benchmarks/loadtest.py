@@ -0,0 +1,231 @@
+'''
+Replay a mix of register, login, list, search and item update traffic
+against a running server and report throughput and latency percentiles
+per endpoint as JSON.
+
+Seed the database first so the virtual users have data to work on:
+
+    $ python manage.py seed --users 100 --bucketlists 20 --items 10
+    $ python benchmarks/loadtest.py --users 100 --concurrency 16 \\
+        --duration 60 --output results.json
+
+Rate limits apply to the load like any other client, run the server
+with RATE_LIMITS and RATE_LIMIT_DEFAULT relaxed to measure capacity.
+'''
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from bucketlist_api.seed import WORDS, seed_usernames  # noqa: E402
+
+# operation: share of the requests
+DEFAULT_MIX = {
+    'register': 1,
+    'login': 4,
+    'list': 50,
+    'search': 15,
+    'update_item': 30
+}
+
+
+def percentile(latencies, fraction):
+    # nearest rank percentile of sorted latencies
+    if not latencies:
+        return None
+    rank = max(int(round(fraction * len(latencies))) - 1, 0)
+    return latencies[min(rank, len(latencies) - 1)]
+
+
+class Results(object):
+    '''
+    Latencies and status codes per operation, shared by the workers
+    '''
+
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, status, elapsed):
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(elapsed)
+            statuses = self.statuses.setdefault(operation, {})
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    def report(self, duration, options):
+        endpoints = {}
+        for operation, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            statuses = self.statuses[operation]
+            endpoints[operation] = {
+                'requests': len(latencies),
+                'errors': sum(count for status, count in statuses.items()
+                              if not status.startswith(('2', '3'))),
+                'statuses': statuses,
+                'throughput': len(latencies) / duration,
+                'mean': sum(latencies) / len(latencies),
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99)
+            }
+        requests = sum(result['requests'] for result in endpoints.values())
+        return {
+            'started': options['started'],
+            'options': options,
+            'duration': duration,
+            'requests': requests,
+            'throughput': requests / duration,
+            'endpoints': endpoints
+        }
+
+
+class VirtualUser(object):
+    '''
+    One seeded user replaying the mix, with its own token and data
+    '''
+
+    def __init__(self, base_url, username, password, rng):
+        self.base_url = base_url.rstrip('/') + '/api/v1'
+        self.username = username
+        self.password = password
+        self.rng = rng
+        self.token = None
+        self.items = []
+
+    def request(self, method, path, data=None):
+        # return the status and the decoded json body, if any
+        headers = {'Token': self.token} if self.token else {}
+        body = urlencode(data).encode() if data is not None else None
+        request = Request(self.base_url + path, body, headers, method=method)
+        try:
+            with urlopen(request, timeout=30) as response:
+                return response.status, json.loads(response.read() or 'null')
+        except HTTPError as error:
+            return error.code, None
+
+    def login(self):
+        status, body = self.request('POST', '/auth/login', {
+            'username': self.username, 'password': self.password})
+        if status == 200:
+            self.token = body['token']
+        return status
+
+    def register(self):
+        return self.request('POST', '/auth/register', {
+            'username': 'load{}'.format(self.rng.getrandbits(48)),
+            'password': self.password})[0]
+
+    def list(self):
+        status, body = self.request(
+            'GET', '/bucketlists?limit={}'.format(self.rng.choice((5, 20))))
+        if status == 200 and not self.items:
+            self.items = [
+                (bucketlist['id'], item['id'])
+                for bucketlist in body['data'].values()
+                for item in bucketlist['items']]
+        return status
+
+    def search(self):
+        return self.request('GET', '/bucketlists?q={}'.format(
+            self.rng.choice(WORDS)))[0]
+
+    def update_item(self):
+        if not self.items:
+            return self.list()
+        bucketlist_id, item_id = self.rng.choice(self.items)
+        return self.request(
+            'PUT', '/bucketlists/{}/items/{}'.format(bucketlist_id, item_id),
+            {'done': self.rng.choice(('true', 'false'))})[0]
+
+
+def run_worker(users, mix, deadline, max_requests, counter, results, rng):
+    # replay operations picked by weight until the deadline or the
+    # request budget runs out
+    operations, weights = zip(*sorted(mix.items()))
+    while time.time() < deadline:
+        with counter['lock']:
+            if max_requests and counter['sent'] >= max_requests:
+                return
+            counter['sent'] += 1
+        user = rng.choice(users)
+        operation = rng.choices(operations, weights)[0]
+        if user.token is None and operation != 'register':
+            operation = 'login'
+        started = time.time()
+        try:
+            status = getattr(user, operation)()
+        except (URLError, OSError) as error:
+            status = type(error).__name__
+        results.record(operation, status, time.time() - started)
+
+
+def parse_mix(value):
+    # "list=50,search=15" into {'list': 50, 'search': 15}
+    mix = {}
+    for part in value.split(','):
+        operation, weight = part.split('=')
+        if operation not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(
+                'unknown operation {}'.format(operation))
+        mix[operation] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=10,
+                        help='seeded users to log in as')
+    parser.add_argument('--prefix', default='seed',
+                        help='username prefix given to manage.py seed')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30,
+                        help='seconds to run for')
+    parser.add_argument('--requests', type=int, default=0,
+                        help='stop after this many requests, 0 for no cap')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='weights, e.g. list=50,search=15,update_item=30')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed, the same seed replays the same mix')
+    parser.add_argument('--output', help='write the JSON report here')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    users = [VirtualUser(args.url, username, args.password,
+                         random.Random(rng.getrandbits(32)))
+             for username in seed_usernames(args.users, args.prefix)]
+    results = Results()
+    counter = {'sent': 0, 'lock': threading.Lock()}
+    options = dict(vars(args), started=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    started = time.time()
+    deadline = started + args.duration
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        workers = [executor.submit(
+            run_worker, users, args.mix, deadline, args.requests, counter,
+            results, random.Random(rng.getrandbits(32)))
+            for _ in range(args.concurrency)]
+        for worker in workers:
+            worker.result()
+    report = results.report(time.time() - started, options)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as destination:
+            destination.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
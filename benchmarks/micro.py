@@ -0,0 +1,272 @@
+'''
+Microbenchmarks of the code that runs on every request, with a
+regression gate against a stored baseline.
+
+    $ python benchmarks/micro.py              # fail on a regression
+    $ python benchmarks/micro.py --advisory   # only report regressions
+    $ python benchmarks/micro.py --save       # record a new baseline
+
+Each timing is divided by a calibration workload timed right before
+and after it, so a baseline recorded on one machine stays comparable on
+another and a slow moment of a shared host affects both sides. Code
+bound by the interpreter is calibrated with a pure Python loop, the
+pages, which spend most of their time in SQLite, with the raw SQL of a
+page run through the DBAPI. The run exits with 1 when a benchmark is
+slower than the baseline by more than --threshold (0.5, i.e. 50%, by
+default) in --retries measurements.
+
+Even so, single measurements vary by 10-40% on a quiet machine, and the
+shortest benchmarks (item_as_dict, the tokens) by up to 80%; only a
+slowdown over the threshold in every retry counts, which a real one of
+50% passes and the noise measured here did not. Busy or throttled
+machines (laptops on battery, a test suite running alongside) can be
+slower still: there pass --advisory to print the regressions without
+failing. CI runs the gate with a wider threshold and more retries, see
+.travis.yml.
+'''
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from flask import g  # noqa: E402
+
+from bucketlist_api import db  # noqa: E402
+from bucketlist_api.app import app  # noqa: E402
+from bucketlist_api.models import (  # noqa: E402
+    BucketList, BucketListItem, Principal, Rendering, User)
+from bucketlist_api.resources import BucketListAPI  # noqa: E402
+from bucketlist_api.seed import seed_database  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+
+def calibrate():
+    # a fixed interpreter workload the benchmarks are expressed in
+    values = {}
+    for number in range(2000):
+        values[str(number)] = [number] * 4
+    return sum(len(value) for value in values.values())
+
+
+def sqlite_workload(connection):
+    # a fixed SQLite workload on the fixtures: the statements of a page of
+    # 20 bucketlists with their items, without SQLAlchemy
+    def calibrate_sqlite():
+        cursor = connection.cursor()
+        cursor.execute('SELECT count(*) FROM bucket_list')
+        cursor.fetchall()
+        cursor.execute('SELECT id, name, date_created, date_modified, '
+                       'created_by FROM bucket_list ORDER BY id LIMIT 20')
+        ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT id, name, done, date_created, date_modified, '
+                       'bucketlist_id FROM bucket_list_item WHERE '
+                       'bucketlist_id IN ({}) ORDER BY id'.format(
+                           ', '.join('?' * len(ids))), ids)
+        cursor.fetchall()
+        cursor.close()
+    return calibrate_sqlite
+
+
+def best_time(function, repeat=5, min_time=0.1):
+    # the best seconds per call of repeat runs lasting at least min_time,
+    # without the collector pausing at random points like timeit
+    gc.collect()
+    gc.disable()
+    try:
+        return _best_time(function, repeat, min_time)
+    finally:
+        gc.enable()
+
+
+def _best_time(function, repeat, min_time):
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - started) / number)
+    return min(timings)
+
+
+def fixtures():
+    # an in-memory database of one user with 500 bucketlists of 10 items,
+    # one with 100 items and one with none
+    db.create_all()
+    seed_database(1, 500, 10, seed=0, prefix='bench')
+    user = User.query.first()
+    large = BucketList('Large Bucketlist', user.id)
+    empty = BucketList('Empty Bucketlist', user.id)
+    db.session.add_all([large, empty])
+    db.session.flush()
+    db.session.add_all(BucketListItem('Item {}'.format(number), large.id)
+                       for number in range(100))
+    db.session.commit()
+    return user, large, empty
+
+
+def benchmarks():
+    # name: (function, calibration), over the fixtures
+    user, large, empty = fixtures()
+    medium = BucketList.query.filter(
+        BucketList.id != large.id, BucketList.id != empty.id).first()
+    preloaded = {bucketlist.id: BucketList.load_items([bucketlist])[
+        bucketlist.id] for bucketlist in (empty, medium, large)}
+    item = preloaded[medium.id][0]
+    token = user.generate_auth_token()
+    g.user = Principal(user.id, user.username)
+    resource = BucketListAPI()
+    query = BucketList.query.filter_by(created_by=user.id)
+
+    sparse = Rendering(fields=('id', 'name', 'items'), item_fields=('name',))
+
+    calibrate_sqlite = sqlite_workload(
+        db.session.connection().connection.connection)
+
+    def paginate(page, limit, rendering=Rendering()):
+        # a page as BucketListAPI.get renders it, sparse ones from rows
+        bucketlists = query.with_entities(*rendering.columns) if (
+            rendering.sparse) else query
+        return lambda: resource._BucketListAPI__paginate(
+            bucketlists, page, limit, 'http://localhost/', rendering)
+
+    benchmarks = {
+        'bucketlist_as_dict[0 items]':
+            lambda: empty.as_dict(preloaded[empty.id]),
+        'bucketlist_as_dict[10 items]':
+            lambda: medium.as_dict(preloaded[medium.id]),
+        'bucketlist_as_dict[100 items]':
+            lambda: large.as_dict(preloaded[large.id]),
+        'item_as_dict': item.as_dict,
+        'generate_auth_token': user.generate_auth_token,
+        'verify_auth_token': lambda: User.verify_auth_token(token)
+    }
+    database_benchmarks = {
+        'bucketlist_as_dict[10 items, lazy]': lambda: medium.as_dict(),
+        'paginate[page 1, limit 20]': paginate(1, 20),
+        'paginate[page 1, limit 100]': paginate(1, 100),
+        'paginate[page 20, limit 20]': paginate(20, 20),
+        'paginate[page 1, limit 20, fields=id,name,items.name]':
+            paginate(1, 20, sparse),
+        'paginate[page 1, limit 20, include_items=count]':
+            paginate(1, 20, Rendering(('count', None))),
+        'paginate[page 1, limit 20, include_items=false]':
+            paginate(1, 20, Rendering(('false', None)))
+    }
+    calibrated = {name: (function, calibrate)
+                  for name, function in benchmarks.items()}
+    calibrated.update((name, (function, calibrate_sqlite))
+                      for name, function in database_benchmarks.items())
+    return calibrated
+
+
+def run(selected=None, repeat=7, names=None):
+    # return {name: calibrated time} of the benchmarks matching selected,
+    # or of names. Each is divided by its calibration, the best of right
+    # before and right after it.
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    results = {}
+    with app.test_request_context():
+        db.drop_all()
+        for name, (function, calibration) in sorted(benchmarks().items()):
+            if selected and selected not in name or (
+                    names is not None and name not in names):
+                continue
+            before = best_time(calibration, repeat)
+            seconds = best_time(function, repeat)
+            after = best_time(calibration, repeat)
+            results[name] = {'seconds': seconds,
+                             'relative': seconds / min(before, after)}
+        db.session.remove()
+    return results
+
+
+def compare(results, baseline, threshold):
+    # return (name, change) of the benchmarks over the threshold
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        change = result['relative'] / baseline[name]['relative'] - 1
+        print('{:<40} {:>10.1f} us {:>+8.1%}'.format(
+            name, result['seconds'] * 1e6, change))
+        if change > threshold:
+            regressions.append((name, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='allowed slowdown, 0.5 is 50%%')
+    parser.add_argument('--advisory', action='store_true',
+                        help='report regressions without failing, for '
+                        'noisy hosts')
+    parser.add_argument('--filter', help='run the benchmarks named like this')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--retries', type=int, default=2,
+                        help='times a regression is measured again')
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.repeat)
+    if args.save:
+        # the best of a few runs, a baseline taken in a slow moment would
+        # hide real regressions
+        for _ in range(args.retries):
+            for name, result in run(args.filter, args.repeat).items():
+                if result['relative'] < results[name]['relative']:
+                    results[name] = result
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as source:
+                baseline = json.load(source)
+        baseline.update(results)
+        with open(args.baseline, 'w') as destination:
+            json.dump(baseline, destination, indent=2, sort_keys=True)
+            destination.write('\n')
+        print('saved {} benchmarks to {}'.format(len(results), args.baseline))
+        return 0
+    with open(args.baseline) as source:
+        baseline = json.load(source)
+    regressions = compare(results, baseline, args.threshold)
+    for _ in range(args.retries):
+        if not regressions:
+            break
+        # a shared machine can be slow for a moment, only a slowdown that
+        # reproduces counts
+        print('measuring {} again'.format(len(regressions)))
+        rerun = run(repeat=args.repeat,
+                    names={name for name, _ in regressions})
+        for name, result in rerun.items():
+            if result['relative'] < results[name]['relative']:
+                results[name] = result
+        regressions = compare(
+            {name: results[name] for name, _ in regressions}, baseline,
+            args.threshold)
+    for name, change in regressions:
+        print('REGRESSION {} is {:.1%} slower than the baseline'.format(
+            name, change), file=sys.stderr)
+    return 1 if regressions and not args.advisory else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,11 @@
+import os
+
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+
+from bucketlist_api.routing import RoutingSQLAlchemy
 
 app = Flask(__name__)
-app.config.from_object('config.DevelopmentConfig')
+# the config class, e.g. config.ProductionConfig, from APP_SETTINGS
+app.config.from_object(os.getenv('APP_SETTINGS', 'config.DevelopmentConfig'))
 app.config.from_envvar('BUCKETLIST_SETTINGS', silent=True)
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
@@ -0,0 +1,281 @@
+'''
+A read-only asyncio server for GET /bucketlists and GET /bucketlists/id.
+
+Requires aiohttp and aiosqlite (pip install aiohttp aiosqlite), and an
+SQLite database. It answers like BucketListAPI.get and reuses its
+queries, search, token checks and serializers, but a request waiting on
+a slow client costs a coroutine instead of a thread, so one process can
+serve thousands of concurrent reads. Run it next to the WSGI server and
+route the GETs to it:
+
+    $ python -m bucketlist_api.aio
+'''
+import asyncio
+from collections import namedtuple, OrderedDict
+import math
+import os
+
+import aiosqlite
+from aiohttp import web
+from sqlalchemy import func
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import Query
+from werkzeug.exceptions import HTTPException
+
+from bucketlist_api import db
+from bucketlist_api.app import app
+from bucketlist_api.cache import response_cache
+from bucketlist_api.models import (
+    BUCKETLIST_FIELDS, ITEM_FIELDS, BucketList, BucketListItem, Principal,
+    Rendering, User, cached_principal, first_items, items_count_query,
+    principal_cache, principal_key)
+from bucketlist_api.search import search_bucketlists
+from bucketlist_api.serializers import fast_dumps
+from bucketlist_api.utils import (
+    decode_cursor, encode_cursor, include_items, page_limit, sparse_fields)
+
+
+class Database(object):
+    '''
+    A pool of aiosqlite connections running SQLAlchemy queries, with
+    the rows converted by the column types like the ORM does
+    '''
+
+    def __init__(self, path, size, pragmas):
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas
+        self.dialect = db.engine.dialect
+        self._connections = None
+        self._row_types = {}
+
+    async def open(self):
+        self._connections = asyncio.Queue()
+        for _ in range(self.size):
+            connection = await aiosqlite.connect(self.path)
+            for pragma, value in self.pragmas.items():
+                await connection.execute('PRAGMA {} = {}'.format(
+                    pragma, value))
+            self._connections.put_nowait(connection)
+
+    async def close(self):
+        while not self._connections.empty():
+            await self._connections.get_nowait().close()
+
+    async def fetch(self, query):
+        # the rows of a Query as namedtuples of its column names
+        statement = query.statement
+        compiled = statement.compile(dialect=self.dialect)
+        parameters = [compiled.params[name] for name in compiled.positiontup]
+        processors = [column.type.dialect_impl(
+            self.dialect).result_processor(self.dialect, None)
+            for column in statement.inner_columns]
+        connection = await self._connections.get()
+        try:
+            cursor = await connection.execute(str(compiled), parameters)
+            rows = await cursor.fetchall()
+            names = tuple(column[0] for column in cursor.description)
+            await cursor.close()
+        finally:
+            self._connections.put_nowait(connection)
+        row_type = self._row_types.get(names)
+        if row_type is None:
+            row_type = self._row_types[names] = namedtuple('Row', names)
+        return [row_type(*(process(value) if process else value
+                           for process, value in zip(processors, row)))
+                for row in rows]
+
+
+async def authenticate(request):
+    # the Principal of the Token header, as verify_token finds it
+    token = request.headers.get('Token')
+    if not token:
+        raise json_error(401, 'Token is required in the Request Header!')
+    key = principal_key(token)
+    principal = cached_principal(key)
+    if principal is not None:
+        return principal
+    try:
+        decoded = User.decode_auth_token(token)
+    except ValueError:
+        raise json_error(401, 'You have supplied an Invalid TOKEN')
+    if decoded is None:
+        raise json_error(401, 'TOKEN Supplied Expired')
+    generation = response_cache.generation(decoded[0]['id'])
+    users = await request.app['database'].fetch(Query(
+        (User.id, User.username)).filter(User.id == decoded[0]['id']))
+    if not users:
+        raise json_error(401, 'TOKEN Supplied Expired')
+    principal = Principal(*users[0])
+    principal_cache.set(key, (principal, generation),
+                        expires=decoded[1]['exp'])
+    return principal
+
+
+def request_rendering(request):
+    # the Rendering of the include_items and fields of the query string
+    return Rendering(
+        include_items(request.query.get('include_items')),
+        *sparse_fields(request.query.get('fields'), BUCKETLIST_FIELDS,
+                       ITEM_FIELDS))
+
+
+async def render(database, bucketlists, rendering):
+    # bucketlists keyed like __serialize_bucketlists, with the items of
+    # include_items in one query
+    items = OrderedDict((bucketlist.id, []) for bucketlist in bucketlists)
+    counts = dict.fromkeys(items, 0)
+    if rendering.mode == 'count' and items:
+        counts.update(await database.fetch(items_count_query(list(items))))
+    elif rendering.mode in ('all', 'first') and items:
+        query = Query(rendering.item_columns).filter(
+            BucketListItem.bucketlist_id.in_(list(items))).order_by(
+            BucketListItem.id)
+        if rendering.limit is not None:
+            query = query.filter(first_items(list(items), rendering.limit))
+        for item in await database.fetch(query):
+            items[item.bucketlist_id].append(item)
+    return OrderedDict(
+        ('Bucketlist{}'.format(bucketlist.id), rendering.render(
+            bucketlist, items[bucketlist.id], counts[bucketlist.id]))
+        for bucketlist in bucketlists)
+
+
+async def get_bucketlist(request):
+    database = request.app['database']
+    principal = await authenticate(request)
+    view = request_rendering(request)
+    bucketlist_id = int(request.match_info['bucketlist_id'])
+    bucketlists = await database.fetch(Query(view.columns).filter(
+        BucketList.id == bucketlist_id,
+        BucketList.created_by == principal.id, ~BucketList.deleted))
+    if not bucketlists:
+        raise json_error(404, 'Bucketlist {} does not exist'.format(
+            bucketlist_id))
+    data = await render(database, bucketlists, view)
+    return json_response(data.popitem()[1])
+
+
+async def get_bucketlists(request):
+    # page, cursor and search like BucketListAPI.get
+    database = request.app['database']
+    principal = await authenticate(request)
+    limit = page_limit({'limit': int_arg(request, 'limit', 20)})
+    page = int_arg(request, 'page', 1)
+    search_name = request.query.get('q')
+    view = request_rendering(request)
+    bucketlists = Query(view.columns).filter(
+        BucketList.created_by == principal.id, ~BucketList.deleted)
+    if not await exists(database, bucketlists):
+        raise json_error(404, 'You don\'t have any bucketlist yet!')
+    if search_name:
+        bucketlists = search_bucketlists(
+            bucketlists, principal.id, search_name)
+        if not await exists(database, bucketlists):
+            raise json_error(404, 'no bucketlist containing {}'.format(
+                search_name))
+    url = str(request.url.origin()) + '/api/v1/bucketlists?limit={}'.format(
+        limit)
+    for name in ('include_items', 'fields'):
+        if name in request.query:
+            url += '&{}={}'.format(name, request.query[name])
+    if request.query.get('cursor') is not None:
+        last_id = decode_cursor(request.query['cursor'])
+        if last_id is not None:
+            bucketlists = bucketlists.filter(BucketList.id > last_id)
+        rows = await database.fetch(bucketlists.order_by(None).order_by(
+            BucketList.id).limit(limit + 1))
+        next_cursor = encode_cursor(rows[limit - 1].id) if (
+            len(rows) > limit) else None
+        return json_response({
+            'data': await render(database, rows[:limit], view),
+            'next_cursor': next_cursor,
+            'next_page': url + '&cursor=' + next_cursor if (
+                next_cursor) else None
+        })
+    total = (await database.fetch(bucketlists.order_by(None).with_entities(
+        func.count(BucketList.id))))[0][0]
+    pages = int(math.ceil(total / float(limit))) if limit else 0
+    rows = await database.fetch(bucketlists.limit(limit).offset(
+        (page - 1) * limit))
+    return json_response({
+        'data': await render(database, rows, view),
+        'pages': pages,
+        'previous_page': url + '&page={}'.format(page - 1) if (
+            page > 1) else None,
+        'next_page': url + '&page={}'.format(page + 1) if (
+            page < pages) else None
+    })
+
+
+async def exists(database, query):
+    return (await database.fetch(Query(query.exists())))[0][0]
+
+
+def int_arg(request, name, default):
+    try:
+        return int(request.query.get(name, default))
+    except ValueError:
+        raise json_error(400, '{} must be an integer'.format(name))
+
+
+def json_response(data, status=200):
+    return web.Response(body=fast_dumps(data), status=status,
+                        content_type='application/json')
+
+
+def json_error(status, message):
+    # the body flask_restful's abort gives, raised out of a handler
+    return HTTPError(json_response({'message': message}, status))
+
+
+class HTTPError(Exception):
+    '''
+    Carries an error response out of a handler
+    '''
+
+    def __init__(self, response):
+        super(HTTPError, self).__init__(response.status)
+        self.response = response
+
+
+@web.middleware
+async def errors(request, handler):
+    # errors raised by handlers or by the shared flask_restful helpers
+    try:
+        return await handler(request)
+    except HTTPError as error:
+        return error.response
+    except HTTPException as error:
+        message = (getattr(error, 'data', None) or {}).get(
+            'message', error.description)
+        return json_response({'message': message}, error.code)
+
+
+def create_app(config=None):
+    config = config or app.config
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'sqlite':
+        raise ValueError('the asyncio read path needs an SQLite database')
+    application = web.Application(middlewares=[errors])
+    application['database'] = Database(
+        url.database or ':memory:', config['AIO_CONNECTIONS'],
+        config.get('SQLITE_PRAGMAS', {}))
+
+    async def open_database(application):
+        await application['database'].open()
+
+    async def close_database(application):
+        await application['database'].close()
+
+    application.on_startup.append(open_database)
+    application.on_cleanup.append(close_database)
+    for path in ('/api/v1/bucketlists', '/api/v1/bucketlists/'):
+        application.router.add_get(path, get_bucketlists)
+    application.router.add_get(
+        r'/api/v1/bucketlists/{bucketlist_id:\d+}', get_bucketlist)
+    return application
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), port=int(os.getenv('PORT', 5001)))
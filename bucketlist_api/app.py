@@ -1,8 +1,23 @@
+from flask import Response
 from flask_restful import Api
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from bucketlist_api import app
 from bucketlist_api.resources import (
-    BucketListAPI, BucketListItemAPI, UserRegAPI, UserLoginAPI)
+    BucketListAPI, BucketListExportAPI, BucketListItemAPI,
+    BucketListItemBatchAPI, UserRegAPI, UserLoginAPI)
+from bucketlist_api import metrics
+from bucketlist_api.database import retry_on_lock
+from bucketlist_api.serializers import output_json
+from bucketlist_api.throttle import throttle
+
+if app.config['PROXY_FIX_HOPS']:
+    # remote_addr becomes the address the outermost trusted proxy saw
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_HOPS'])
+app.before_request(metrics.start_request)
+app.after_request(metrics.finish_request)
+app.before_request(throttle.admit)
+app.teardown_request(throttle.release)
 
 
 @app.route('/', methods=['GET'])
@@ -11,19 +26,29 @@ def home_page():
     'Register and Login to start using the Service', 200
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics_page():
+    return Response(metrics.metrics.render(),
+                    mimetype='text/plain; version=0.0.4')
+
+
 @app.errorhandler(404)
 def handle_error(message):
     return "Resource not found check docs for valid URL endpoints", 404
 
 
-api = Api(app, prefix='/api/v1')
+api = Api(app, prefix='/api/v1', decorators=[retry_on_lock])
+api.representation('application/json')(output_json)
 
 api.add_resource(UserRegAPI, "/auth/register")
 api.add_resource(UserLoginAPI, "/auth/login")
 api.add_resource(BucketListAPI, "/bucketlists",
                  "/bucketlists/",
                  "/bucketlists/<int:bucketlist_id>")
+api.add_resource(BucketListExportAPI, "/bucketlists/export")
 api.add_resource(
     BucketListItemAPI, "/bucketlists/<int:bucketlist_id>/items",
     "/bucketlists/<int:bucketlist_id>/items/",
     "/bucketlists/<int:bucketlist_id>/items/<int:item_id>")
+api.add_resource(BucketListItemBatchAPI,
+                 "/bucketlists/<int:bucketlist_id>/items/batch")
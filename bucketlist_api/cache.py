@@ -0,0 +1,300 @@
+from collections import OrderedDict
+from functools import wraps
+import json
+import os
+import random
+import sqlite3
+from threading import local, Lock
+import time
+
+from flask import g, request, Response
+from werkzeug.http import unquote_etag
+
+from bucketlist_api import app
+from bucketlist_api.routing import read_from_replica
+
+
+class LRUCache(object):
+    '''
+    A bounded in-process cache that evicts the least recently used
+    entry when full. Entries expire after ttl seconds or at an earlier
+    expiry time given when they are set.
+
+    params: maxsize, ttl (seconds)
+    '''
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        # return the live value for key or None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, expires=None):
+        # store value until expires (epoch seconds) or the ttl, if sooner
+        if self.maxsize <= 0:
+            return
+        expiry = time.time() + self.ttl
+        if expires is not None:
+            expiry = min(expiry, expires)
+        with self._lock:
+            self._entries[key] = (value, expiry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_where(self, predicate):
+        # drop every entry whose value matches the predicate
+        with self._lock:
+            for key in [key for key, (value, _) in self._entries.items()
+                        if predicate(value)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._entries)}
+
+
+class MemoryBackend(object):
+    '''
+    Response cache backend local to the process. Only coherent when
+    the app runs in a single process, writes in another worker are not
+    seen until entries expire.
+    '''
+
+    def __init__(self, maxsize, ttl):
+        self.entries = LRUCache(maxsize, ttl)
+        self.generations = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries.set(key, value)
+
+    def generation(self, owner):
+        return self.generations.get(owner, 0)
+
+    def bump(self, owner):
+        self.generations[owner] = self.generation(owner) + 1
+
+    def stats(self):
+        return self.entries.stats()
+
+
+def private_file(path):
+    # create path readable and writable by this user only, or make it so.
+    # A file another user owns, or a link in its place, could read or
+    # forge the cache and is refused, like the journals SQLite keeps
+    # beside it (which it creates with the mode of the database)
+    for name in (path, path + '-wal', path + '-shm'):
+        flags = os.O_RDWR | getattr(os, 'O_NOFOLLOW', 0)
+        if name == path:
+            flags |= os.O_CREAT
+        try:
+            descriptor = os.open(name, flags, 0o600)
+        except FileNotFoundError:
+            continue
+        except OSError as error:
+            raise PermissionError('cannot open {} privately: {}'.format(
+                name, error))
+        try:
+            if os.fstat(descriptor).st_uid != os.geteuid():
+                raise PermissionError(
+                    '{} is owned by another user'.format(name))
+            os.fchmod(descriptor, 0o600)
+        finally:
+            os.close(descriptor)
+
+
+class SQLiteBackend(object):
+    '''
+    Response cache backend in a SQLite file, shared by every worker
+    process on the host. Values are stored as JSON. The file is private
+    to the user running the app, see private_file.
+    '''
+
+    def __init__(self, path, maxsize, ttl):
+        private_file(path)
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._local = local()
+
+    def _connection(self):
+        # one connection per thread, opened again in forked workers
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache ('
+                'key TEXT PRIMARY KEY, value TEXT, expires REAL)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS response_generation ('
+                'owner INTEGER PRIMARY KEY, generation INTEGER)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM response_cache WHERE key = ? AND expires > ?',
+            (key, time.time())).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0], object_pairs_hook=OrderedDict)
+
+    def set(self, key, value):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time() + self.ttl))
+            if random.random() < 0.01:
+                self._prune(connection)
+
+    def _prune(self, connection):
+        # drop expired entries, then the ones expiring first if still full
+        connection.execute(
+            'DELETE FROM response_cache WHERE expires <= ?', (time.time(),))
+        connection.execute(
+            'DELETE FROM response_cache WHERE key IN (SELECT key FROM '
+            'response_cache ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+            (self.maxsize,))
+
+    def generation(self, owner):
+        row = self._connection().execute(
+            'SELECT generation FROM response_generation WHERE owner = ?',
+            (owner,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, owner):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'INSERT OR IGNORE INTO response_generation VALUES (?, 0)',
+                (owner,))
+            connection.execute(
+                'UPDATE response_generation SET generation = generation + 1 '
+                'WHERE owner = ?', (owner,))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class ResponseCache(object):
+    '''
+    Caches the responses of read endpoints per user and URL.
+
+    Keys carry the user's generation, which every write by the user
+    bumps. Reads after a write miss the old entries, and a read that
+    raced the write stores its result under the old generation where
+    it is never served. Responses read from a replica are not stored:
+    a lagging replica could return the state before the write under the
+    new generation.
+
+    The backend comes from RESPONSE_CACHE_BACKEND: 'memory', 'sqlite'
+    (RESPONSE_CACHE_PATH) or None to disable caching.
+    '''
+
+    def __init__(self, config):
+        self.config = config
+        self._settings = None
+        self._backend = None
+
+    @property
+    def backend(self):
+        # (re)build the backend when the config changes
+        settings = tuple(self.config.get(key) for key in (
+            'RESPONSE_CACHE_BACKEND', 'RESPONSE_CACHE_SIZE',
+            'RESPONSE_CACHE_TTL', 'RESPONSE_CACHE_PATH'))
+        if settings != self._settings:
+            name, maxsize, ttl, path = settings
+            if name == 'memory':
+                self._backend = MemoryBackend(maxsize, ttl)
+            elif name == 'sqlite':
+                self._backend = SQLiteBackend(path, maxsize, ttl)
+            else:
+                self._backend = None
+            self._settings = settings
+        return self._backend
+
+    def generation(self, owner):
+        # the owner's generation, always 0 without a backend
+        backend = self.backend
+        return backend.generation(owner) if backend is not None else 0
+
+    def invalidate(self, owner):
+        if self.backend is not None:
+            self.backend.bump(owner)
+
+    def stats(self):
+        if self.backend is None:
+            return {'hits': 0, 'misses': 0, 'hit_rate': 0.0}
+        stats = self.backend.stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def __call__(self, view):
+        # decorate a resource method to serve its 200s from the cache
+        @wraps(view)
+        def cached_view(*args, **kwargs):
+            backend = self.backend
+            if backend is None:
+                return view(*args, **kwargs)
+            key = '{}:{}:{}'.format(
+                g.user.id, backend.generation(g.user.id), request.url)
+            cached = backend.get(key)
+            if cached is not None:
+                data, code, headers = cached
+                etag = headers.get('ETag')
+                if etag and unquote_etag(etag)[0] in request.if_none_match:
+                    return Response(status=304, headers=headers)
+                return data, code, headers
+            response = view(*args, **kwargs)
+            if isinstance(response, tuple) and response[1] == 200 and not (
+                    read_from_replica()):
+                headers = dict(response[2]) if len(response) > 2 else {}
+                backend.set(key, (response[0], 200, headers))
+            return response
+        return cached_view
+
+
+response_cache = ResponseCache(app.config)
+
+
+def invalidate_user_responses():
+    # forget the cached reads of the user making the request
+    user = g.get('user')
+    if user is not None:
+        response_cache.invalidate(user.id)
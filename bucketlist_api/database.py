@@ -0,0 +1,66 @@
+from functools import wraps
+import random
+import sqlite3
+import time
+
+from flask import g
+from flask_restful import abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from bucketlist_api import app, db
+from bucketlist_api.metrics import metrics
+
+
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    # SQLITE_PRAGMAS of the config on every new SQLite connection
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in app.config.get('SQLITE_PRAGMAS', {}).items():
+            cursor.execute('PRAGMA {} = {}'.format(pragma, value))
+    finally:
+        cursor.close()
+
+
+def is_lock_error(error):
+    # SQLite gave up waiting for another connection's lock
+    return isinstance(error, OperationalError) and isinstance(
+        error.orig, sqlite3.OperationalError) and 'locked' in str(error.orig)
+
+
+def retry_on_lock(view):
+    # run a view again, from a clean session, when SQLite reports lock
+    # contention past its busy_timeout. The waits grow exponentially from
+    # SQLITE_LOCK_BACKOFF up to SQLITE_LOCK_BACKOFF_MAX with full jitter,
+    # for SQLITE_LOCK_RETRIES attempts, then the request gets a 503.
+    @wraps(view)
+    def retrying_view(*args, **kwargs):
+        retries = app.config.get('SQLITE_LOCK_RETRIES', 0)
+        waited = 0.0
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    return view(*args, **kwargs)
+                except OperationalError as error:
+                    if not is_lock_error(error):
+                        raise
+                    db.session.rollback()
+                    g.pop('repository', None)
+                    metrics.inc('bucketlist_db_lock_errors_total')
+                    if attempt == retries:
+                        break
+                    delay = random.uniform(0, min(
+                        app.config['SQLITE_LOCK_BACKOFF_MAX'],
+                        app.config['SQLITE_LOCK_BACKOFF'] * 2 ** attempt))
+                    time.sleep(delay)
+                    waited += delay
+        finally:
+            if waited:
+                metrics.observe('bucketlist_db_lock_wait_seconds', (), waited)
+        metrics.inc('bucketlist_db_lock_failures_total')
+        abort(503, message='Database is busy, try again later')
+    return retrying_view
@@ -0,0 +1,231 @@
+from collections import defaultdict
+import glob
+import json
+import os
+from threading import Lock
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from bucketlist_api import app, db
+from bucketlist_api.cache import response_cache
+from bucketlist_api.models import password_hasher, principal_cache
+from bucketlist_api.throttle import throttle
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Metrics(object):
+    '''
+    Counters and histograms of the process, rendered in the Prometheus
+    text exposition format.
+
+    With METRICS_DIR set every worker writes its samples to a file of
+    its own there, at most every METRICS_FLUSH_INTERVAL seconds, and
+    render() adds up the files of all the workers on the host.
+    '''
+
+    def __init__(self, config):
+        self.config = config
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed = 0
+        self._lock = Lock()
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self.counters[name, labels] += value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        # histograms are [bucket counts..., sum, count]
+        with self._lock:
+            histogram = self.histograms.setdefault(
+                (name, labels), [0] * len(buckets) + [0, 0])
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        # the samples of the process, gauges read from the components
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'counters': [[name, labels, value] for (name, labels), value
+                             in self.counters.items()],
+                'histograms': [[name, labels, list(histogram)]
+                               for (name, labels), histogram
+                               in self.histograms.items()],
+                'gauges': component_gauges()
+            }
+
+    def flush(self, force=False):
+        # write the snapshot where the other workers can read it
+        directory = self.config.get('METRICS_DIR')
+        now = time.time()
+        if not directory or not force and (
+                now - self.flushed < self.config['METRICS_FLUSH_INTERVAL']):
+            return
+        self.flushed = now
+        path = os.path.join(directory, '{}.json'.format(os.getpid()))
+        with open(path + '.tmp', 'w') as snapshot:
+            json.dump(self.snapshot(), snapshot)
+        os.rename(path + '.tmp', path)
+
+    def collect(self):
+        # snapshots of every worker on the host, or only of this process
+        directory = self.config.get('METRICS_DIR')
+        if not directory:
+            return [self.snapshot()]
+        self.flush(force=True)
+        snapshots = []
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            try:
+                with open(path) as snapshot:
+                    snapshots.append(json.load(snapshot))
+            except (IOError, ValueError):
+                continue  # a worker is replacing its file
+        return snapshots
+
+    def render(self):
+        counters, gauges, histograms = defaultdict(float), defaultdict(
+            float), {}
+        for snapshot in self.collect():
+            for name, labels, value in snapshot['counters']:
+                counters[name, freeze(labels)] += value
+            for name, labels, samples in snapshot['histograms']:
+                total = histograms.setdefault(
+                    (name, freeze(labels)), [0] * len(samples))
+                for index, value in enumerate(samples):
+                    total[index] += value
+            if process_alive(snapshot['pid']):
+                for name, labels, value in snapshot['gauges']:
+                    gauges[name, freeze(labels)] += value
+        lines = []
+        for kind, samples in (('counter', counters), ('gauge', gauges)):
+            for name in sorted({name for name, _ in samples}):
+                lines.append('# TYPE {} {}'.format(name, kind))
+                lines.extend('{}{} {}'.format(
+                    name, format_labels(labels), value)
+                    for (metric, labels), value in sorted(samples.items())
+                    if metric == name)
+        for name in sorted({name for name, _ in histograms}):
+            lines.append('# TYPE {} histogram'.format(name))
+            buckets = QUERY_BUCKETS if name.endswith(
+                'queries_per_request') else LATENCY_BUCKETS
+            for (metric, labels), samples in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(buckets, samples):
+                    lines.append('{}_bucket{} {}'.format(name, format_labels(
+                        labels + (('le', str(bound)),)), count))
+                lines.append('{}_bucket{} {}'.format(name, format_labels(
+                    labels + (('le', '+Inf'),)), samples[-1]))
+                lines.append('{}_sum{} {}'.format(
+                    name, format_labels(labels), samples[-2]))
+                lines.append('{}_count{} {}'.format(
+                    name, format_labels(labels), samples[-1]))
+        return '\n'.join(lines) + '\n'
+
+
+def freeze(labels):
+    # labels come back from json as lists
+    return tuple(tuple(label) for label in labels)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, value)
+                          for key, value in labels) + '}'
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def component_gauges():
+    # the counters the caches, throttle and hasher keep themselves
+    samples = []
+    for cache, stats in (('principal', principal_cache.stats()),
+                         ('response', response_cache.stats())):
+        for key in ('hits', 'misses'):
+            samples.append(['bucketlist_cache_{}'.format(key),
+                            [['cache', cache]], stats[key]])
+    for key, value in sorted(throttle.stats().items()):
+        samples.append(['bucketlist_throttle_{}'.format(key), [], value])
+    for key, value in sorted(db.replica_stats().items()):
+        samples.append(['bucketlist_replica_{}'.format(key), [], value])
+    for key, value in sorted(password_hasher.stats().items()):
+        samples.append(['bucketlist_password_{}'.format(key), [], value])
+    return samples
+
+
+metrics = Metrics(app.config)
+
+
+def start_request():
+    # before_request hook
+    g.metrics_started = time.time()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+
+def finish_request(response):
+    # after_request hook, records latency, status and database use
+    started = g.get('metrics_started')
+    if started is None:
+        return response
+    endpoint = (('endpoint', request.endpoint or 'unmatched'),)
+    metrics.inc('bucketlist_requests_total', endpoint + (
+        ('method', request.method), ('status', str(response.status_code))))
+    metrics.observe('bucketlist_request_duration_seconds', endpoint,
+                    time.time() - started)
+    metrics.observe('bucketlist_db_queries_per_request', endpoint,
+                    g.db_queries, QUERY_BUCKETS)
+    metrics.inc('bucketlist_db_seconds_total', endpoint, g.db_seconds)
+    metrics.flush()
+    return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.time())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def finish_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.time() - conn.info['query_started'].pop()
+    metrics.inc('bucketlist_db_queries_total')
+    metrics.inc('bucketlist_db_query_seconds_total', value=elapsed)
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+
+
+@event.listens_for(Engine, 'engine_connect')
+def time_checkouts(connection, branch):
+    # SQLAlchemy has no event before a pool checkout, so the connect of
+    # each pool is wrapped once to time how long checkouts wait
+    pool = connection.engine.pool
+    if getattr(pool, 'checkout_timed', False):
+        return
+    checkout = pool.connect
+
+    def timed_checkout():
+        started = time.time()
+        try:
+            return checkout()
+        finally:
+            metrics.observe('bucketlist_db_checkout_wait_seconds', (),
+                            time.time() - started)
+    pool.connect = timed_checkout
+    pool.checkout_timed = True
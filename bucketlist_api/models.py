@@ -1,10 +1,23 @@
-from collections import OrderedDict
+from collections import namedtuple, OrderedDict
+from hashlib import sha256
 
 from itsdangerous import (TimedJSONWebSignatureSerializer
                           as Serializer, BadSignature, SignatureExpired)
-from passlib.apps import custom_app_context as pwd_context
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Query
 
 from bucketlist_api import app, db
+from bucketlist_api.cache import LRUCache, response_cache
+from bucketlist_api.passwords import PasswordHasher
+from bucketlist_api.routing import replica_reads
+from bucketlist_api.serializers import cached_serializer
+
+# the authenticated user as seen by the resources, cached per token with
+# the generation of the user (see cached_principal)
+Principal = namedtuple('Principal', ['id', 'username'])
+principal_cache = LRUCache(app.config['PRINCIPAL_CACHE_SIZE'],
+                           app.config['PRINCIPAL_CACHE_TTL'])
+password_hasher = PasswordHasher(app.config)
 
 
 class Base(db.Model):
@@ -42,13 +55,18 @@ class User(Base):
         self.password = password
 
     def hash_password(self):
-        # generate a hash for the password
-        self.password_hash = pwd_context.encrypt(self.password)
+        # generate a hash for the password on the hashing pool
+        self.password_hash = password_hasher.hash(self.password)
         return self.password_hash
 
     def verify_password(self, password):
-        # check password hash matches password.
-        return pwd_context.verify(password, self.password_hash)
+        # check password hash matches password, rehashing it when it was
+        # made at another cost than the configured one.
+        valid, new_hash = password_hasher.verify_and_update(
+            password, self.password_hash)
+        if valid and new_hash:
+            self.password_hash = new_hash
+        return valid
 
     def generate_auth_token(self, expiration=86400):
         # generate an auth token that lasts for a day.
@@ -56,16 +74,47 @@ class User(Base):
         return s.dumps({'id': self.id})
 
     @staticmethod
-    def verify_auth_token(token):
-        # check token to ascertain validity
+    def decode_auth_token(token):
+        # the (payload, header) of a valid token, None when it has expired
         s = Serializer(app.config['SECRET_KEY'])
         try:
-            data = s.loads(token)
+            return s.loads(token, return_header=True)
         except BadSignature:
             raise ValueError  # invalid token
         except SignatureExpired:
             return None
-        return User.query.get(data['id'])
+
+    @staticmethod
+    def verify_auth_token(token, return_header=False):
+        # check token to ascertain validity
+        decoded = User.decode_auth_token(token)
+        if decoded is None:
+            return None
+        data, header = decoded
+        user = User.query.get(data['id'])
+        return (user, header) if return_header else user
+
+    @staticmethod
+    def load_principal(token):
+        # the id and username behind a token, cached until the token expires
+        # or the user changes
+        digest = principal_key(token)
+        principal = cached_principal(digest)
+        if principal is None:
+            decoded = User.decode_auth_token(token)
+            if decoded is None:
+                return None
+            data, header = decoded
+            # read before the user, so a change in between is not missed
+            generation = response_cache.generation(data['id'])
+            with replica_reads():
+                user = User.query.get(data['id'])
+            if not user:
+                return None
+            principal = Principal(user.id, user.username)
+            principal_cache.set(digest, (principal, generation),
+                                expires=header['exp'])
+        return principal
 
     def as_dict(self):
         return "Hello your username is {} ".format(
@@ -77,6 +126,36 @@ class User(Base):
         }
 
 
+def principal_key(token):
+    # tokens are cached by digest, not kept in memory as they are
+    return sha256(token.encode('utf-8')).hexdigest()
+
+
+def cached_principal(digest):
+    # the cached principal of a token digest, unless the generation of its
+    # user moved since. Generations live in the response cache store,
+    # which the 'sqlite' backend shares between the workers; without a
+    # shared backend another worker sees a change after PRINCIPAL_CACHE_TTL
+    cached = principal_cache.get(digest)
+    if cached is None:
+        return None
+    principal, generation = cached
+    if generation != response_cache.generation(principal.id):
+        principal_cache.discard(digest)
+        return None
+    return principal
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_principal(mapper, connection, user):
+    # cached principals must not outlive a change to their user, in this
+    # process or any other sharing the generations
+    principal_cache.discard_where(
+        lambda cached: cached[0].id == user.id)
+    response_cache.invalidate(user.id)
+
+
 class BucketList(Base):
     '''
     This is the one stop data place for
@@ -84,48 +163,197 @@ class BucketList(Base):
     '''
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     name = db.Column(db.String(256))
+    # deleted bucketlists are hidden from every read until the reclaimer
+    # purges them and their items in batches
+    deleted = db.Column(db.Boolean, nullable=False, default=False,
+                        server_default='0')
+    # bumped by every write to the bucketlist or its items, the ETags use
+    # it as date_modified only has second precision
+    version = db.Column(db.Integer, nullable=False, default=0,
+                        server_default='0')
     items = db.relationship('BucketListItem',
                             backref=db.backref('bucket_list', lazy='joined'),
-                            cascade='all, delete-orphan', lazy='dynamic')
+                            cascade='all, delete-orphan', lazy='dynamic',
+                            passive_deletes=True)
 
     def __init__(self, bucketlistname, created_by):
         self.name = bucketlistname
         self.created_by = created_by
 
-    def as_dict(self):
-        # render the bucketlists
-        items = [item.as_dict() for item in self.items.all()]
-        return OrderedDict([
-            ('id', str(self.id)),
-            ('name', str(self.name)),
-            ('items', items),
-            ('date_created', str(self.date_created)),
-            ('date_modified', str(self.date_modified)),
-            ('created_by', str(self.created_by))
-        ])
+    def as_dict(self, items=None):
+        # render the bucketlists, items may be preloaded with load_items
+        if items is None:
+            items = self.items.order_by(BucketListItem.id).all()
+        return serialize_bucketlist(self, list(map(serialize_item, items)))
+
+    @staticmethod
+    def load_items(bucketlists, limit=None, columns=None):
+        # fetch the items of all the bucketlists in a single IN (...) query,
+        # only the first limit items of each when limit is given. With
+        # columns (which must include bucketlist_id) the items are rows of
+        # those columns instead of entities
+        items = OrderedDict((bucketlist.id, []) for bucketlist in bucketlists)
+        if items:
+            if columns is None:
+                query = BucketListItem.query.options(
+                    db.lazyload(BucketListItem.bucket_list))
+            else:
+                query = db.session.query(*columns)
+            query = query.filter(
+                BucketListItem.bucketlist_id.in_(list(items))).order_by(
+                BucketListItem.id)
+            if limit is not None:
+                query = query.filter(first_items(list(items), limit))
+            for item in query:
+                items[item.bucketlist_id].append(item)
+        return items
+
+    @staticmethod
+    def count_items(bucketlists):
+        # the number of items of each bucketlist in one grouped query
+        counts = OrderedDict((bucketlist.id, 0) for bucketlist in bucketlists)
+        if counts:
+            counts.update(items_count_query(list(counts)).with_session(
+                db.session()))
+        return counts
 
     def __repr__(self):
         return '<BucketList {}>'.format(self.name)
 
 
+def bump_version(bucketlist_id):
+    # the UPDATE recording a change to the items of the bucketlist, it
+    # leaves the bucketlist's own date_modified as it is
+    table = BucketList.__table__
+    return table.update().where(table.c.id == bucketlist_id).values(
+        version=table.c.version + 1, date_modified=table.c.date_modified)
+
+
+@event.listens_for(BucketList, 'before_update')
+def bump_bucketlist_version(mapper, connection, bucketlist):
+    bucketlist.version = BucketList.version + 1
+
+
+# names are unique among the user's live bucketlists, so a deleted name can
+# be reused before it is purged. The index also serves created_by lookups.
+db.Index('uq_bucket_list_created_by_name', BucketList.created_by,
+         BucketList.name, unique=True, sqlite_where=~BucketList.deleted,
+         postgresql_where=~BucketList.deleted)
+
+
 class BucketListItem(Base):
     '''
     This is the data center for a single
     item in the bucket list
     '''
+    # names are unique per bucketlist, the index also serves the
+    # bucketlist_id lookups
+    __table_args__ = (db.UniqueConstraint(
+        'bucketlist_id', 'name',
+        name='uq_bucket_list_item_bucketlist_id_name'),)
     done = db.Column(db.Boolean, default=False)
     name = db.Column(db.String(256))
     bucketlist_id = db.Column(db.Integer, db.ForeignKey(
-        'bucket_list.id'))
+        'bucket_list.id', ondelete='CASCADE'))
 
     def __init__(self, item_name, bucketlist_id):
         self.name = item_name
         self.bucketlist_id = bucketlist_id
 
     def as_dict(self):
-        return {col.name: str(getattr(
-            self, col.name))
-            for col in self.__table__.columns if col.name != 'bucketlist_id'}
+        return serialize_item(self)
 
     def __repr__(self):
         return '<BucketListItem {}>'.format(self.name)
+
+
+@event.listens_for(BucketListItem, 'after_insert')
+@event.listens_for(BucketListItem, 'after_update')
+@event.listens_for(BucketListItem, 'after_delete')
+def bump_item_bucketlist_version(mapper, connection, item):
+    # items written with the ORM, bulk statements call bump_version
+    connection.execute(bump_version(item.bucketlist_id))
+
+
+def first_items(bucketlist_ids, limit):
+    # a filter keeping the first limit items, by id, of each bucketlist,
+    # ranked with a window function over those bucketlists only
+    ranked = select([BucketListItem.id, func.row_number().over(
+        partition_by=BucketListItem.bucketlist_id,
+        order_by=BucketListItem.id).label('position')]).where(
+        BucketListItem.bucketlist_id.in_(bucketlist_ids)).alias('ranked')
+    return BucketListItem.id.in_(select([ranked.c.id]).where(
+        ranked.c.position <= limit))
+
+
+def items_count_query(bucketlist_ids):
+    # (bucketlist_id, number of items) of the bucketlists having items
+    return Query((BucketListItem.bucketlist_id,
+                  func.count(BucketListItem.id))).filter(
+        BucketListItem.bucketlist_id.in_(bucketlist_ids)).group_by(
+        BucketListItem.bucketlist_id)
+
+
+def select_columns(model, fields):
+    # the columns of the model for the fields, each once, in order
+    return tuple(getattr(model, field) for field in OrderedDict.fromkeys(
+        fields))
+
+
+def bucketlist_serializer(fields, items='items'):
+    # a serializer of the bucketlist fields, with the items field rendered
+    # under the key items: 'items', 'items_count' or None to leave it out
+    keys = tuple(items if field == 'items' else field for field in fields
+                 if field != 'items' or items)
+    return cached_serializer(keys, (items,) if items in keys else ())
+
+
+# the fields of the as_dict renderings, in their order
+BUCKETLIST_FIELDS = ('id', 'name', 'items', 'date_created', 'date_modified',
+                     'created_by')
+ITEM_FIELDS = tuple(column.name for column in BucketListItem.__table__.columns
+                    if column.name != 'bucketlist_id')
+
+# the as_dict renderings, compiled once from the fields of the models.
+# include_items=false and count (see utils.include_items) leave out items
+serialize_bucketlist = bucketlist_serializer(BUCKETLIST_FIELDS)
+serialize_bucketlist_summary = bucketlist_serializer(BUCKETLIST_FIELDS, None)
+serialize_bucketlist_counted = bucketlist_serializer(
+    BUCKETLIST_FIELDS, 'items_count')
+serialize_item = cached_serializer(ITEM_FIELDS)
+
+
+class Rendering(object):
+    '''
+    What a bucketlist read renders, from its include_items and fields=
+    parameters (see utils), and the columns it must select for that.
+    A sparse rendering (fields=) is built from column rows, the default
+    one from entities with as_dict.
+    '''
+
+    def __init__(self, include=('all', None), fields=None, item_fields=None):
+        self.mode, self.limit = include
+        self.sparse = fields is not None
+        fields = fields or BUCKETLIST_FIELDS
+        if 'items' not in fields:
+            self.mode = 'false'
+        item_fields = item_fields or ITEM_FIELDS
+        self.fields = fields
+        self.item_fields = item_fields
+        self.serialize = bucketlist_serializer(fields, {
+            'false': None, 'count': 'items_count'}.get(self.mode, 'items'))
+        self.serialize_item = cached_serializer(item_fields)
+        # the ids key the pages and the items, which are grouped by list
+        self.columns = select_columns(BucketList, ('id',) + tuple(
+            field for field in fields if field != 'items'))
+        self.item_columns = select_columns(
+            BucketListItem, item_fields + ('bucketlist_id',))
+
+    def render(self, bucketlist, items=None, items_count=None):
+        # one bucketlist, with its rows of item_columns or its item count
+        if self.mode == 'false':
+            return self.serialize(bucketlist)
+        elif self.mode == 'count':
+            return self.serialize(bucketlist, items_count)
+        return self.serialize(bucketlist, list(map(
+            self.serialize_item, items)))
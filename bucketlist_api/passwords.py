@@ -0,0 +1,97 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+from threading import Lock
+import time
+
+from passlib.context import CryptContext
+
+
+class PasswordHasherBusy(Exception):
+    '''
+    Raised when too many passwords are already waiting to be hashed
+    '''
+
+
+def crypt_context(rounds):
+    # sha512_crypt at exactly the configured cost, so hashes made at any
+    # other cost (or with sha256_crypt) verify but need an update
+    return CryptContext(
+        schemes=['sha512_crypt', 'sha256_crypt'], deprecated=['sha256_crypt'],
+        sha512_crypt__default_rounds=rounds, sha512_crypt__min_rounds=rounds,
+        sha512_crypt__max_rounds=rounds)
+
+
+def hash_password(password, rounds):
+    return crypt_context(rounds).hash(password)
+
+
+def verify_and_update(password, password_hash, rounds):
+    # return (valid, new hash or None)
+    return crypt_context(rounds).verify_and_update(password, password_hash)
+
+
+class PasswordHasher(object):
+    '''
+    Hashes and verifies passwords on a bounded process pool, so a burst
+    of registrations or logins does not hold the GIL of the request
+    workers.
+
+    config: PASSWORD_HASH_ROUNDS, the sha512_crypt cost.
+    PASSWORD_HASH_WORKERS, the pool size, 0 hashes on the calling thread.
+    PASSWORD_HASH_QUEUE, hashes in progress before PasswordHasherBusy.
+    '''
+
+    def __init__(self, config):
+        self.config = config
+        self.hashes = 0
+        self.hash_seconds = 0.0
+        self.max_hash_seconds = 0.0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.rejected = 0
+        self._lock = Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def hash(self, password):
+        return self._run(
+            hash_password, password, self.config['PASSWORD_HASH_ROUNDS'])
+
+    def verify_and_update(self, password, password_hash):
+        return self._run(verify_and_update, password, password_hash,
+                         self.config['PASSWORD_HASH_ROUNDS'])
+
+    def _executor(self, workers):
+        # a pool per process, forked workers must not share the parent's
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ProcessPoolExecutor(workers)
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def _run(self, function, *args):
+        with self._lock:
+            if self.queue_depth >= self.config['PASSWORD_HASH_QUEUE']:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        start = time.time()
+        try:
+            workers = self.config['PASSWORD_HASH_WORKERS']
+            if not workers:
+                return function(*args)
+            return self._executor(workers).submit(function, *args).result()
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self.queue_depth -= 1
+                self.hashes += 1
+                self.hash_seconds += elapsed
+                self.max_hash_seconds = max(self.max_hash_seconds, elapsed)
+
+    def stats(self):
+        return {'hashes': self.hashes, 'hash_seconds': self.hash_seconds,
+                'max_hash_seconds': self.max_hash_seconds,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'rejected': self.rejected}
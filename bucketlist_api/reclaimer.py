@@ -0,0 +1,71 @@
+import threading
+
+from sqlalchemy import exists, select
+
+from bucketlist_api import db
+from bucketlist_api.app import app
+from bucketlist_api.models import BucketList, BucketListItem
+
+
+def reclaim_deleted(batch_size=None, max_batches=None, engine=None):
+    # purge the bucketlists marked deleted and their items, batch_size rows
+    # per transaction so a list of any size never holds the write lock for
+    # long. Items go first, with the orphans of lists deleted before the
+    # soft delete, then the emptied lists. Stops after
+    # max_batches transactions when given and returns the rows deleted.
+    batch_size = batch_size or app.config['RECLAIM_BATCH_SIZE']
+    engine = engine or db.engine
+    bucketlist_table = BucketList.__table__
+    item_table = BucketListItem.__table__
+    deleted_bucketlists = select([bucketlist_table.c.id]).where(
+        bucketlist_table.c.deleted)
+    batches = (
+        ('items', item_table, select([item_table.c.id]).where(
+            item_table.c.bucketlist_id.in_(deleted_bucketlists))),
+        ('items', item_table, select([item_table.c.id]).where(
+            ~exists().where(
+                bucketlist_table.c.id == item_table.c.bucketlist_id))),
+        ('bucketlists', bucketlist_table, deleted_bucketlists.where(
+            ~exists().where(
+                item_table.c.bucketlist_id == bucketlist_table.c.id)))
+    )
+    totals = {'items': 0, 'bucketlists': 0}
+    transactions = 0
+    for name, table, ids in batches:
+        batch = ids.limit(batch_size).alias('batch')
+        while max_batches is None or transactions < max_batches:
+            with engine.begin() as connection:
+                deleted = connection.execute(table.delete().where(
+                    table.c.id.in_(select([batch.c.id])))).rowcount
+            transactions += 1
+            totals[name] += deleted
+            if deleted < batch_size:
+                break
+    return totals
+
+
+class Reclaimer(threading.Thread):
+    '''
+    Runs reclaim_deleted every RECLAIM_INTERVAL seconds in the background,
+    on engine when given, until stopped. The server runs one in the
+    gunicorn master for all the workers.
+    '''
+
+    def __init__(self, interval=None, engine=None):
+        super(Reclaimer, self).__init__(name='reclaimer')
+        self.daemon = True
+        self.interval = interval or app.config['RECLAIM_INTERVAL']
+        self.engine = engine
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            with app.app_context():
+                try:
+                    reclaim_deleted(engine=self.engine)
+                except Exception:
+                    # a busy or unreachable database is retried next time
+                    app.logger.exception('reclaiming deleted bucketlists')
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,117 @@
+from flask import g
+from sqlalchemy import and_, func, select
+
+from bucketlist_api import app, db
+from bucketlist_api.models import BucketList, BucketListItem, bump_version
+
+
+class Repository(object):
+    '''
+    Data access for one request on behalf of one user.
+
+    Every bucketlist and item is loaded at most once per request, with
+    the ownership check in the same query, and changes to an entity are
+    written with a single UPDATE when the session is flushed.
+    '''
+
+    def __init__(self, owner):
+        self.owner = owner
+        self._bucketlists = {}
+        self._items = {}
+
+    def bucketlist(self, bucketlist_id):
+        # the user's bucketlist with the id, or None
+        if bucketlist_id not in self._bucketlists:
+            self._bucketlists[bucketlist_id] = BucketList.query.filter(
+                BucketList.id == bucketlist_id,
+                BucketList.created_by == self.owner,
+                ~BucketList.deleted).first()
+        return self._bucketlists[bucketlist_id]
+
+    def bucketlist_row(self, bucketlist_id, columns):
+        # the columns of the user's bucketlist with the id, or None
+        return db.session.query(*columns).filter(
+            BucketList.id == bucketlist_id,
+            BucketList.created_by == self.owner,
+            ~BucketList.deleted).first()
+
+    def item(self, bucketlist_id, item_id):
+        # the item of the user's bucketlist, or None, in one joined query
+        key = (bucketlist_id, item_id)
+        if key not in self._items:
+            self._items[key] = BucketListItem.query.options(
+                db.lazyload(BucketListItem.bucket_list)).join(
+                BucketList,
+                BucketList.id == BucketListItem.bucketlist_id).filter(
+                BucketListItem.id == item_id,
+                BucketListItem.bucketlist_id == bucketlist_id,
+                BucketList.created_by == self.owner,
+                ~BucketList.deleted).first()
+        return self._items[key]
+
+    @staticmethod
+    def update(entity, **changes):
+        # set the changed columns, flushed as one UPDATE on commit.
+        # returns False when nothing changes
+        changes = {column: value for column, value in changes.items()
+                   if getattr(entity, column) != value}
+        for column, value in changes.items():
+            setattr(entity, column, value)
+        return bool(changes)
+
+    def delete_item(self, item):
+        db.session.delete(item)
+        self._items = {key: value for key, value in self._items.items()
+                       if value is not item}
+
+    def item_filter(self, bucketlist_id, ids=None, done=None, prefix=None):
+        # a WHERE clause for the items of the user's bucketlist matching
+        # every given filter, with the ownership check as a subquery so a
+        # bulk statement needs no SELECT first
+        table = BucketListItem.__table__
+        clauses = [table.c.bucketlist_id == bucketlist_id,
+                   table.c.bucketlist_id.in_(select([BucketList.id]).where(
+                       and_(BucketList.id == bucketlist_id,
+                            BucketList.created_by == self.owner,
+                            ~BucketList.deleted)))]
+        if ids is not None:
+            clauses.append(table.c.id.in_(ids))
+        if done is not None:
+            clauses.append(table.c.done == done)
+        if prefix:
+            clauses.append(func.substr(table.c.name, 1, len(prefix)) == prefix)
+        return and_(*clauses)
+
+    def update_items(self, bucketlist_id, where, **values):
+        # one UPDATE of the items matching where, returns the rows changed
+        self._items = {}
+        table = BucketListItem.__table__
+        return self._bump(bucketlist_id, db.session.execute(
+            table.update().where(where).values(**values)).rowcount)
+
+    def delete_items(self, bucketlist_id, where):
+        # one DELETE of the items matching where, returns the rows deleted
+        self._items = {}
+        table = BucketListItem.__table__
+        return self._bump(bucketlist_id, db.session.execute(
+            table.delete().where(where)).rowcount)
+
+    @staticmethod
+    def _bump(bucketlist_id, changed):
+        # a bulk statement changing items changes the bucketlist's version
+        if changed:
+            db.session.execute(bump_version(bucketlist_id))
+        return changed
+
+
+@app.before_request
+def forget_repository():
+    # requests sharing an app context (as in tests) must not share one
+    g.pop('repository', None)
+
+
+def repository():
+    # the repository of the current request
+    if g.get('repository') is None:
+        g.repository = Repository(g.user.id)
+    return g.repository
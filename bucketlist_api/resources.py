@@ -1,14 +1,31 @@
 from collections import OrderedDict
 
-from flask import g, request
+from flask import current_app, g, request, Response, stream_with_context
 from flask_httpauth import HTTPTokenAuth
 from flask_restful import abort, Resource
-from sqlalchemy import and_
+from sqlalchemy import and_, bindparam, case, func, literal, or_
+from sqlalchemy.exc import IntegrityError
 from webargs.flaskparser import use_args
+from werkzeug.urls import url_encode
 
 from bucketlist_api.utils import (user_reg_login_field, name_field,
-                                  name_done_field, limit_field, save)
-from bucketlist_api.models import BucketList, BucketListItem, User
+                                  name_done_field, limit_field,
+                                  item_batch_field, item_filter_field,
+                                  item_bulk_update_field, item_page_field,
+                                  include_items, sparse_fields, page_limit,
+                                  save,
+                                  encode_cursor, decode_cursor, make_etag,
+                                  etag_header, not_modified)
+from bucketlist_api.cache import invalidate_user_responses, response_cache
+from bucketlist_api.models import (
+    BUCKETLIST_FIELDS, ITEM_FIELDS, BucketList, BucketListItem, Rendering,
+    User, bump_version, select_columns)
+from bucketlist_api.serializers import cached_serializer
+from bucketlist_api.passwords import PasswordHasherBusy
+from bucketlist_api.repository import repository
+from bucketlist_api.routing import replica_reads
+from bucketlist_api.search import search_bucketlists
+from bucketlist_api.transfer import export_bucketlists
 from bucketlist_api import db
 
 auth = HTTPTokenAuth()
@@ -20,7 +37,7 @@ def verify_token(token):
     if not token:
         abort(401, message='Token is required in the Request Header!')
     try:
-        user = User.verify_auth_token(token)
+        user = User.load_principal(token)
     except ValueError:
         abort(401, message='You have supplied an Invalid TOKEN')
     if not user:
@@ -66,7 +83,10 @@ class UserRegAPI(Resource):
     def __create_new_user(self):
         # create a user an instance of the User Model
         user = User(self.username.title().strip(), self.password)
-        user.hash_password()
+        try:
+            user.hash_password()
+        except PasswordHasherBusy:
+            abort(503, message='Too many registrations, try again later')
         return user
 
     def __check_user_exists(self):
@@ -96,10 +116,13 @@ class UserLoginAPI(Resource):
     def __verify_user(self):
         # verify a user's detail's
         user = self.__get_user()
-        if user:
-            return user
-        else:
-            abort(404, message='Invalid username/password')
+        try:
+            if user and user.verify_password(self.password):
+                db.session.commit()  # keeps a rehashed password
+                return user
+        except PasswordHasherBusy:
+            abort(503, message='Too many logins, try again later')
+        abort(404, message='Invalid username/password')
 
     @staticmethod
     def generate_auth_token(user):
@@ -124,9 +147,14 @@ class BucketListAPI(Resource):
     params:
     [POST] bucketlist 'name', location json body
     [PUT] buckelistname or done location json body
-    [GET] limit, name search(q), query string
+    [GET] limit, name search(q), page or cursor, include_items and
+    fields, query string
+
+    batch_item_loading: load the items of a whole page of bucketlists
+    with one query instead of one query per bucketlist.
     '''
     decorators = [auth.login_required]
+    batch_item_loading = True
 
     def __init__(self):
         self.created_by = g.user.id
@@ -138,32 +166,56 @@ class BucketListAPI(Resource):
             abort(405, message="method not supported for the URL")
         self.bucketlist_name = args.get('name')
         bucketlist = self.__create_bucketlist()
-        save(bucketlist)
+        save(bucketlist, conflict_message='Bucket List name already exists')
         return bucketlist.as_dict(), 201  # return a serialized objedct
 
+    @replica_reads()
+    @response_cache
     @use_args(limit_field)
     def get(self, args, bucketlist_id=None):
         # get the list of bucket lists or an item and return.
+        # an If-None-Match matching the current ETag gets a bodiless 304.
+        rendering = Rendering(
+            include_items(args.get('include_items')),
+            *sparse_fields(args.get('fields'), BUCKETLIST_FIELDS, ITEM_FIELDS))
         if bucketlist_id:
             # return the bucketlist with the bucketlist id specified
-            bucketlist = self.__get_a_single_bucketlist(bucketlist_id)
-            return bucketlist.as_dict(), 200
+            etag = self.__bucketlist_etag(bucketlist_id)
+            response = not_modified(etag)
+            if response:
+                return response
+            bucketlist = self.__get_a_single_bucketlist(
+                bucketlist_id, rendering)
+            return self.__render(
+                [bucketlist], rendering)[0], 200, etag_header(etag)
         else:
             # implement pagination for name search or bucketlists for user
-            limit = min(args.get('limit', 20), 100)
+            etag = self.__bucketlists_etag()
+            response = not_modified(etag)
+            if response:
+                return response
+            limit = page_limit(args)
             page = args.get('page', 1)
             search_name = args.get('q', None)
-            bucketlists = g.user.bucketlists
+            bucketlists = BucketList.query.filter_by(
+                created_by=self.created_by, deleted=False)
             bucketlists = self.__check_valid_get_params(
                 bucketlists, search_name)
+            if rendering.sparse:
+                # rows of the columns rendered instead of entities
+                bucketlists = bucketlists.with_entities(*rendering.columns)
+            if args.get('cursor') is not None:
+                return self.__paginate_by_cursor(
+                    bucketlists, args['cursor'], limit, request.url_root,
+                    rendering), 200, etag_header(etag)
             data, pages, previous_page, next_page = self.__paginate(
-                bucketlists, page, limit, request.url_root)
+                bucketlists, page, limit, request.url_root, rendering)
             return {
                 'data': data,
                 'pages': pages,
                 'previous_page': previous_page,
                 'next_page': next_page
-            }, 200
+            }, 200, etag_header(etag)
 
     @use_args(name_field)
     def put(self, args, bucketlist_id=None):
@@ -171,17 +223,25 @@ class BucketListAPI(Resource):
         if not bucketlist_id:
             abort(405, message='method not supported for'
                   ' the URL.')
-        if (not BucketList.query.get(bucketlist_id)) or(
-            not(BucketList.query.get(
-                bucketlist_id).created_by == self.created_by)):
+        bucketlist = repository().bucketlist(bucketlist_id)
+        if not bucketlist:
             abort(404, message='invalid url')
         self.bucketlist_name = args.get('name')
         self.__check_valid_bucketlist()
-        if self.__update_bucketlist(bucketlist_id):
-            db.session.commit()
-            return BucketList.query.get(bucketlist_id).as_dict()
-        abort(400, message='Could not update bucketlist {}'.format(
-            bucketlist_id))
+        # renaming to the current name changes nothing and is a conflict
+        # too, the unique constraint catches the names of other lists
+        renamed = repository().update(
+            bucketlist, name=self.bucketlist_name.strip().title())
+        try:
+            if renamed:
+                db.session.commit()
+        except IntegrityError:
+            renamed = False
+        if not renamed:
+            db.session.rollback()
+            abort(400, message='Bucket List name already exists')
+        invalidate_user_responses()
+        return bucketlist.as_dict()
 
     def delete(self, bucketlist_id=None):
         # method view to delete a bucket list with the associated id
@@ -189,6 +249,7 @@ class BucketListAPI(Resource):
             abort(405, message='method not supported for the URL')
         elif self.__delete_bucketlist(bucketlist_id):
             db.session.commit()
+            invalidate_user_responses()
             return 'successfully deleted bucketlist {}'.format(
                 bucketlist_id), 200
         abort(404, message='Bucketlist {} does not exist'.format(
@@ -202,97 +263,255 @@ class BucketListAPI(Resource):
         return bucketlist
 
     def __check_valid_bucketlist(self):
-        # return appropriate error message for invalid bucketlist name
+        # return appropriate error message for invalid bucketlist name,
+        # the unique constraint on (created_by, name) rejects duplicates
         if not self.__check_bucketlist_name():
             abort(400,
                   message='Bucketlist name must be at least 8 characters')
-        elif self.__bucketlist_name_exists():
-            abort(400, message='Bucket List name already exists')
 
     def __check_bucketlist_name(self):
         # bucketlist name must satisfy the condition
         return len(self.bucketlist_name.strip()) > 9
 
-    def __bucketlist_name_exists(self):
-        bucketlist = BucketList.query.filter_by(
-            name=self.bucketlist_name.strip().title()).first()
-        return int(bucketlist.created_by) == self.created_by if (
-            bucketlist) else False
-
     def __delete_bucketlist(self, bucketlist_id):
-        # delete the bucketlist with bucketlist_id
+        # mark the bucketlist with bucketlist_id deleted in one UPDATE, its
+        # items are purged in batches by the reclaimer, see reclaimer.py
         return db.session.query(BucketList).filter(
             and_(
                 BucketList.created_by == self.created_by,
-                BucketList.id == bucketlist_id)).delete()
-
-    def __update_bucketlist(self, bucketlist_id):
-        # for the PUT method update the bucketlist
-        return db.session.query(
-            BucketList).filter(and_(
-                BucketList.created_by == self.created_by,
-                BucketList.id == bucketlist_id)).update(
-                {'name': self.bucketlist_name.strip().title()})
+                BucketList.id == bucketlist_id,
+                ~BucketList.deleted)).update(
+            {'deleted': True}, synchronize_session=False)
 
-    @staticmethod
-    def __paginate(bucketlists, page, limit, url_root):
+    def __paginate(self, bucketlists, page, limit, url_root, rendering):
         # paginate the queried object containing bucketlists
         bucketlists = bucketlists.paginate(
             page=page, per_page=limit, error_out=False)
-        prev_page = str(url_root) +\
-            'api/v1/bucketlists?' + 'limit=' + str(limit) + '&page=' +\
+        prev_page = self.__page_url(url_root, limit) + '&page=' +\
             str(page - 1) if bucketlists.has_prev else None
-        next_page = str(
-            url_root) + 'api/v1/bucketlists?' + 'limit=' +\
-            str(limit) + '&page=' + str(page + 1) if (
-            bucketlists.has_next) else None
-        bucketlists_per_page = OrderedDict([('Bucketlist{}'.format(
-            bucketlist.id), bucketlist.as_dict())
-            for bucketlist in bucketlists.items])
+        next_page = self.__page_url(url_root, limit) + '&page=' +\
+            str(page + 1) if bucketlists.has_next else None
+        bucketlists_per_page = self.__serialize_bucketlists(
+            bucketlists.items, rendering)
         return [bucketlists_per_page, bucketlists.pages, prev_page, next_page]
 
-    def __get_a_single_bucketlist(self, bucketlist_id):
-        # return Erro 404 if it does not exist
-        return BucketList.query.filter(and_(
+    def __paginate_by_cursor(self, bucketlists, cursor, limit, url_root,
+                             rendering):
+        # keyset pagination, constant cost at any depth and no COUNT(*)
+        last_id = decode_cursor(cursor)
+        if last_id is not None:
+            bucketlists = bucketlists.filter(BucketList.id > last_id)
+        # search results are ranked, but keyset pages must follow the key
+        bucketlists = bucketlists.order_by(None).order_by(
+            BucketList.id).limit(limit + 1).all()
+        next_cursor = encode_cursor(bucketlists[limit - 1].id) if (
+            len(bucketlists) > limit) else None
+        next_page = self.__page_url(url_root, limit) + '&cursor=' +\
+            next_cursor if next_cursor else None
+        return {
+            'data': self.__serialize_bucketlists(
+                bucketlists[:limit], rendering),
+            'next_cursor': next_cursor,
+            'next_page': next_page
+        }
+
+    def __page_url(self, url_root, limit):
+        # the link of another page, with the same limit and include_items
+        url = str(url_root) + 'api/v1/bucketlists?' + 'limit=' + str(limit)
+        for name in ('include_items', 'fields'):
+            if name in request.args:
+                url += '&{}={}'.format(name, request.args[name])
+        return url
+
+    def __serialize_bucketlists(self, bucketlists, rendering):
+        # render a page of bucketlists keyed by their ids
+        return OrderedDict([('Bucketlist{}'.format(
+            bucketlist.id), data) for bucketlist, data in zip(
+            bucketlists, self.__render(bucketlists, rendering))])
+
+    def __render(self, bucketlists, rendering):
+        # the bucketlists with the items include_items asks for, loaded
+        # for all of them at once or not at all
+        if rendering.mode == 'false':
+            return [rendering.render(bucketlist) for bucketlist in bucketlists]
+        elif rendering.mode == 'count':
+            counts = BucketList.count_items(bucketlists)
+            return [rendering.render(
+                bucketlist, items_count=counts[bucketlist.id])
+                for bucketlist in bucketlists]
+        elif rendering.sparse:
+            items = BucketList.load_items(
+                bucketlists, rendering.limit, rendering.item_columns)
+            return [rendering.render(bucketlist, items[bucketlist.id])
+                    for bucketlist in bucketlists]
+        elif rendering.mode == 'first' or self.batch_item_loading:
+            items = BucketList.load_items(bucketlists, rendering.limit)
+        else:
+            items = {}
+        return [bucketlist.as_dict(items.get(bucketlist.id))
+                for bucketlist in bucketlists]
+
+    def __bucketlist_etag(self, bucketlist_id):
+        # derive the ETag of a bucketlist from one aggregate query
+        state = db.session.query(
+            BucketList.name, BucketList.date_modified, BucketList.version,
+            *self.__items_state()).outerjoin(
+            BucketListItem,
+            BucketListItem.bucketlist_id == BucketList.id).filter(
             BucketList.created_by == self.created_by,
-            BucketList.id == bucketlist_id)).first_or_404()
+            BucketList.id == bucketlist_id,
+            ~BucketList.deleted).group_by(BucketList.id).first()
+        if not state:
+            abort(404, message='Bucketlist {} does not exist'.format(
+                bucketlist_id))
+        return make_etag(bucketlist_id, request.args.get('include_items'),
+                         request.args.get('fields'), *state)
+
+    def __bucketlists_etag(self):
+        # the ETag of a list page covers all the user's bucketlists and
+        # items, as well as the query string and host the links are built on
+        bucketlists = db.session.query(
+            func.count(BucketList.id), func.max(BucketList.id),
+            func.max(BucketList.date_modified),
+            func.sum(BucketList.version)).filter(
+            BucketList.created_by == self.created_by,
+            ~BucketList.deleted).one()
+        items = db.session.query(*self.__items_state()).join(
+            BucketList, BucketList.id == BucketListItem.bucketlist_id).filter(
+            BucketList.created_by == self.created_by,
+            ~BucketList.deleted).one()
+        return make_etag(request.url, tuple(bucketlists), tuple(items))
+
+    @staticmethod
+    def __items_state():
+        # aggregates that change whenever items are added, removed or
+        # updated. Timestamps only have second precision, the versions of
+        # the bucketlists catch the changes made within the same second
+        return (func.count(BucketListItem.id), func.max(BucketListItem.id),
+                func.max(BucketListItem.date_modified),
+                func.sum(case([(BucketListItem.done, 1)], else_=0)))
+
+    @staticmethod
+    def __get_a_single_bucketlist(bucketlist_id, rendering):
+        # return Error 404 if it does not exist
+        if rendering.sparse:
+            bucketlist = repository().bucketlist_row(
+                bucketlist_id, rendering.columns)
+        else:
+            bucketlist = repository().bucketlist(bucketlist_id)
+        if not bucketlist:
+            abort(404, message='Bucketlist {} does not exist'.format(
+                bucketlist_id))
+        return bucketlist
 
     def __check_valid_get_params(self, bucketlists, search_name=None):
         # return bucketlists based on the condition
-        if not bucketlists.all():
+        if not self.__exists(bucketlists):
             abort(404, message='You don\'t have any bucketlist yet!')
         elif search_name:
             bucketlists = self.__get_bucketlists_with_name(
                 bucketlists, search_name)
-            if not bucketlists:
+            if not self.__exists(bucketlists):
                 abort(404, message='no bucketlist containing {}'.format(
                     search_name))
             return bucketlists
         return bucketlists
 
     @staticmethod
-    def __get_bucketlists_with_name(bucketlists, search_name):
-        # query and return bucketlists matching the name
-        return bucketlists.filter(
-            BucketList.name.ilike("%{}%".format(search_name.title())))
+    def __exists(bucketlists):
+        # cheap EXISTS check instead of loading every row
+        return db.session.query(bucketlists.exists()).scalar()
+
+    def __get_bucketlists_with_name(self, bucketlists, search_name):
+        # query and return bucketlists matching the name or an item name
+        return search_bucketlists(bucketlists, self.created_by, search_name)
+
+
+class BucketListExportAPI(Resource):
+    '''
+    Streams every bucketlist of the user, with its items, as
+    newline delimited json (one bucketlist per line)
+    GET: export the bucketlists
+    '''
+    decorators = [auth.login_required]
+
+    def get(self):
+        # stream lines as rows arrive instead of building the whole body
+        lines = export_bucketlists(
+            g.user.id, current_app.config['EXPORT_BATCH_SIZE'])
+        return Response(stream_with_context(lines),
+                        mimetype='application/x-ndjson')
 
 
 class BucketListItemAPI(Resource):
     '''
     The class for Items in a bucket list
+    GET: a page of the items of the bucketlist, or the item with an id
     POST: creates a new item in the bucketlist
     PUT: updates a bucket list item with an id
-    DELETE: Delete the bucket list item with the ID
+    PATCH: updates every item matching the filters with one UPDATE
+    DELETE: Delete the bucket list item with the ID, or every item
+    matching the filters with one DELETE
 
     params:
+    [GET] limit, cursor, ids, done and prefix, query string
     [POST] item_name
     [PUT] item_name or self.done
+    [PATCH] done and/or rename_prefix, filtered by ids, done and prefix
+    in the query string
+    [DELETE] ids, done and prefix in the query string
     '''
     decorators = [auth.login_required]
 
     def __init__(self):
         self.created_by = g.user.id
 
+    @replica_reads()
+    @response_cache
+    @use_args(item_page_field, locations=('query',))
+    def get(self, args, bucketlist_id, item_id=None):
+        # an item, or a keyset page of the items matching the filters, so
+        # a bucketlist of any size is read without loading all its items.
+        # With fields= only their columns are selected, as rows
+        fields, _ = sparse_fields(args.pop('fields', None), ITEM_FIELDS)
+        serialize = cached_serializer(fields or ITEM_FIELDS)
+        if fields:
+            items = db.session.query(*select_columns(
+                BucketListItem, ('id',) + fields))
+        else:
+            items = BucketListItem.query.options(
+                db.lazyload(BucketListItem.bucket_list))
+        if item_id:
+            item = items.filter(repository().item_filter(
+                bucketlist_id, ids=[item_id])).first()
+            if not item:
+                abort(404, message='invalid bucketlist/item id in URL')
+            return serialize(item), 200
+        if not repository().bucketlist(bucketlist_id):
+            abort(404, message='invalid URL check bucketlist id')
+        limit = page_limit(args)
+        last_id = decode_cursor(args.pop('cursor', None))
+        items = items.filter(repository().item_filter(
+            bucketlist_id, **self.__item_filters(args)))
+        if last_id is not None:
+            items = items.filter(BucketListItem.id > last_id)
+        items = items.order_by(BucketListItem.id).limit(limit + 1).all()
+        next_cursor = encode_cursor(items[limit - 1].id) if (
+            len(items) > limit) else None
+        return {
+            'data': [serialize(item) for item in items[:limit]],
+            'next_cursor': next_cursor,
+            'next_page': self.__next_page_url(next_cursor) if (
+                next_cursor) else None
+        }, 200
+
+    @staticmethod
+    def __next_page_url(cursor):
+        # the request's own URL with the cursor of the next page
+        args = request.args.copy()
+        args['cursor'] = cursor
+        return request.base_url + '?' + url_encode(args)
+
     @use_args(name_field)
     def post(self, args, bucketlist_id, item_id=None):
         # method to handle post request
@@ -302,18 +521,17 @@ class BucketListItemAPI(Resource):
         self.item_name = args.get('name')
         self.__check_valid_item(bucketlist_id)
         item = self.__create_item(bucketlist_id)
-        save(item)
+        save(item, conflict_message='item name already exists')
         return item.as_dict(), 201
 
     def __check_valid_item(self, bucketlist_id):
-        # return appropriate error message just in case
-        if not self.check_bucket_list_with_user(bucketlist_id):
+        # return appropriate error message just in case, the unique
+        # constraint on (bucketlist_id, name) rejects duplicates
+        if not repository().bucketlist(bucketlist_id):
             abort(404, message='invalid URL check bucketlist id or item id')
         elif not self.check_item_name():
             abort(400, message='item name required'
                   ' and must have at least 10 characters')
-        elif self.check_item_name_with_user():
-            abort(400, message='item name already exists')
 
     def __create_item(self, bucketlist_id):
         # return an item object
@@ -326,69 +544,247 @@ class BucketListItemAPI(Resource):
         if not item_id:
             abort(405,
                   message='The method is not supported for the requested URL')
-        elif not (self.check_bucket_list_with_user(bucketlist_id) and
-                  self.check_item_id_with_bucketlist(
-                item_id, bucketlist_id)):
+        item = repository().item(bucketlist_id, item_id)
+        if not item:
             abort(404, message='invalid bucketlist/item id in URL')
         self.item_name = args.get('name')
         self.done = args.get('done')
-        if (self.check_item_name_with_user()):
-            abort(400, message='item name already exists')
         if (self.item_name is not None) and (not self.check_item_name()):
             abort(400, message='invalid item name')
-        self.update_item(item_id)
-        return BucketListItem.query.get(item_id).as_dict(), 201
+        self.update_item(item)
+        return item.as_dict(), 201
 
-    def delete(self, bucketlist_id, item_id=None):
-        # method handles the delete request to the route
-        if not item_id:
+    @use_args(item_filter_field, locations=('query',))
+    @use_args(item_bulk_update_field, locations=('form', 'json'))
+    def patch(self, filters, changes, bucketlist_id, item_id=None):
+        # update the selected items in a single statement, e.g. mark every
+        # item done or rename the items starting with a prefix
+        if item_id:
+            abort(405,
+                  message='The method is not supported for the requested URL')
+        filters = self.__item_filters(filters)
+        where = repository().item_filter(bucketlist_id, **filters)
+        values = self.__bulk_changes(changes, filters, where)
+        if list(values) == ['done']:
+            # items already in that state are not written again
+            where = and_(where, BucketListItem.done != values['done'])
+        try:
+            updated = repository().update_items(
+                bucketlist_id, where, **values)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            abort(400, message='item name already exists')
+        self.__bulk_done(bucketlist_id, updated)
+        return {'updated': updated}, 200
+
+    @use_args(item_filter_field, locations=('query',))
+    def delete(self, filters, bucketlist_id, item_id=None):
+        # method handles the delete request to the route, without an item
+        # id the items matching the filters go in a single statement
+        if not item_id and not filters:
             abort(
                 405, message='The method is not'
                 ' supported for the requested URL')
-        elif not (self.check_bucket_list_with_user(bucketlist_id) and
-                  self.check_item_id_with_bucketlist(item_id, bucketlist_id)
-                  ):
-            abort(404, message='Invalid URL')
-        elif db.session.query(BucketListItem).filter_by(id=item_id).delete():
+        elif not item_id:
+            where = repository().item_filter(
+                bucketlist_id, **self.__item_filters(filters))
+            deleted = repository().delete_items(bucketlist_id, where)
             db.session.commit()
-            return 'Successfully deleted Item', 200
-        else:
-            abort(501, message='Server Error')
+            self.__bulk_done(bucketlist_id, deleted)
+            return {'deleted': deleted}, 200
+        item = repository().item(bucketlist_id, item_id)
+        if not item:
+            abort(404, message='Invalid URL')
+        repository().delete_item(item)
+        db.session.commit()
+        invalidate_user_responses()
+        return 'Successfully deleted Item', 200
+
+    @staticmethod
+    def __item_filters(filters):
+        # names are stored title cased, so are the prefixes matched on
+        if filters.get('prefix'):
+            filters = dict(filters, prefix=filters['prefix'].title())
+        return filters
+
+    @staticmethod
+    def __bulk_changes(changes, filters, where):
+        # the column values of a bulk update, the renamed names must still
+        # be valid item names
+        values = {}
+        if 'done' in changes:
+            values['done'] = changes['done']
+        rename_prefix = changes.get('rename_prefix', '').strip().title()
+        if rename_prefix:
+            prefix = filters.get('prefix')
+            if not prefix:
+                abort(400, message='rename_prefix needs a prefix filter')
+            if len(rename_prefix) < len(prefix) and db.session.query(
+                    BucketListItem.query.filter(where).filter(
+                        func.length(BucketListItem.name) - len(prefix) +
+                        len(rename_prefix) <= 10).exists()).scalar():
+                abort(400, message='item name must have at least'
+                      ' 10 characters')
+            values['name'] = literal(rename_prefix) + func.substr(
+                BucketListItem.name, len(prefix) + 1)
+        if not values:
+            abort(400, message='nothing to update')
+        return values
+
+    @staticmethod
+    def __bulk_done(bucketlist_id, count):
+        # nothing matched, either no item or no bucketlist of the user
+        if count:
+            invalidate_user_responses()
+        elif not repository().bucketlist(bucketlist_id):
+            abort(404, message='invalid URL check bucketlist id')
 
     def check_item_name(self):
         # check item name for valiity
         return len(self.item_name.strip()) > 10 if self.item_name else False
 
-    def check_bucket_list_with_user(self, bucketlist_id):
-        # current user bucket list returns True
-        bucketlist = BucketList.query.get(bucketlist_id)
-        return bucketlist.created_by == self.created_by if (
-            bucketlist) else False
+    def update_item(self, item):
+        # update the given fields with a single UPDATE. renaming an item to
+        # its own name is a conflict too, the unique constraint catches
+        # the names of the other items in the bucketlist
+        changes = {'done': True} if self.done else {}
+        if self.item_name:
+            changes['name'] = self.item_name.strip().title()
+        renamed = 'name' not in changes or changes['name'] != item.name
+        try:
+            if renamed:
+                repository().update(item, **changes)
+                db.session.commit()
+        except IntegrityError:
+            renamed = False
+        if not renamed:
+            db.session.rollback()
+            abort(400, message='item name already exists')
+        invalidate_user_responses()
+
+
+class BucketListItemBatchAPI(Resource):
+    '''
+    Creates and updates many items of a bucket list in one transaction
+    POST: an item without an id is created, one with an id is updated
+
+    params:
+    [POST] items, a json array of {name} or {id, name and/or done}
+
+    Every item gets its own result; valid items are saved even when
+    others in the same batch are rejected.
+    '''
+    decorators = [auth.login_required]
+
+    def __init__(self):
+        self.created_by = g.user.id
+
+    @use_args(item_batch_field, locations=('json',))
+    def post(self, args, bucketlist_id):
+        # validate the whole batch up front then write it with one commit
+        if not repository().bucketlist(bucketlist_id):
+            abort(404, message='invalid URL check bucketlist id')
+        items = args['items']
+        taken_names = self.__taken_names(items, bucketlist_id)
+        item_ids = self.__item_ids_in_bucketlist(items, bucketlist_id)
+        results, accepted, inserts, renames, marks = [], [], [], [], []
+        for index, item in enumerate(items):
+            name = item.get('name', '').strip().title() or None
+            result = {'index': index}
+            results.append(result)
+            error = self.__check_batch_item(item, name, taken_names, item_ids)
+            if error:
+                result['status'], result['message'] = error
+                continue
+            if name:
+                taken_names.add(name)
+            if 'id' not in item:
+                inserts.append({'name': name, 'done': item.get('done', False),
+                                'bucketlist_id': bucketlist_id})
+            if 'id' in item and name:
+                renames.append({'item_id': item['id'], 'name': name})
+            if 'id' in item and 'done' in item:
+                marks.append({'item_id': item['id'], 'done': item['done']})
+            result['status'] = 200 if 'id' in item else 201
+            accepted.append((result, item.get('id', name)))
+        if accepted:
+            self.__write(bucketlist_id, inserts, renames, marks)
+            self.__render(accepted, bucketlist_id)
+        return {'results': results}, 200
 
     @staticmethod
-    def check_item_id_with_bucketlist(item_id, bucketlist_id):
-        # check the bucketlist item and the bucketlist
-        bucketlistitem = BucketListItem.query.get(item_id)
-        return int(bucketlistitem.bucketlist_id) == bucketlist_id if (
-            bucketlistitem) else False
-
-    def check_item_name_with_user(self):
-        bucketlistitem = BucketListItem.query.filter_by(
-            name=self.item_name.strip().title()).first() if (
-            self.item_name) else False
-        if bucketlistitem:
-            return BucketList.query.get(
-                bucketlistitem.bucketlist_id).created_by == self.created_by
-        return False
-
-    def update_item(self, item_id):
-        # update the given field
-        if self.item_name:
-            (db.session.query(BucketListItem).filter_by(
-                id=item_id).update(
-                {'name': self.item_name.strip().title()}))
-        if self.done:
-            (db.session.query(BucketListItem).filter_by(
-                id=item_id).update(
-                {'done': True}))
-        db.session.commit()
+    def __taken_names(items, bucketlist_id):
+        # one query for every name in the batch the bucketlist already has
+        names = {item['name'].strip().title() for item in items
+                 if item.get('name')}
+        if not names:
+            return set()
+        return {name for (name,) in db.session.query(
+            BucketListItem.name).filter(
+            BucketListItem.bucketlist_id == bucketlist_id,
+            BucketListItem.name.in_(names))}
+
+    @staticmethod
+    def __item_ids_in_bucketlist(items, bucketlist_id):
+        # one query for the ids in the batch that belong to the bucketlist
+        ids = {item['id'] for item in items if 'id' in item}
+        if not ids:
+            return set()
+        return {item_id for (item_id,) in db.session.query(
+            BucketListItem.id).filter(
+            BucketListItem.bucketlist_id == bucketlist_id,
+            BucketListItem.id.in_(ids))}
+
+    @staticmethod
+    def __check_batch_item(item, name, taken_names, item_ids):
+        # return (status, message) for an invalid item, None otherwise
+        if 'id' in item and item['id'] not in item_ids:
+            return 404, 'item {} does not exist'.format(item['id'])
+        elif 'id' not in item and not name:
+            return 400, 'item name required'
+        elif name and not len(name) > 10:
+            return 400, 'item name must have at least 10 characters'
+        elif name in taken_names:
+            return 400, 'item name already exists'
+        elif 'id' in item and not (name or 'done' in item):
+            return 400, 'nothing to update'
+
+    @staticmethod
+    def __write(bucketlist_id, inserts, renames, marks):
+        # each kind of change is a single executemany, committed together
+        # with the bump of the bucketlist's version
+        table = BucketListItem.__table__
+        try:
+            if inserts:
+                db.session.execute(table.insert(), inserts)
+            if renames:
+                db.session.execute(table.update().where(
+                    table.c.id == bindparam('item_id')).values(
+                    name=bindparam('name')), renames)
+            if marks:
+                db.session.execute(table.update().where(
+                    table.c.id == bindparam('item_id')).values(
+                    done=bindparam('done')), marks)
+            db.session.execute(bump_version(bucketlist_id))
+            db.session.commit()
+        except IntegrityError:
+            # a concurrent request took one of the names
+            db.session.rollback()
+            abort(400, message='item name already exists, batch not saved')
+        invalidate_user_responses()
+
+    @staticmethod
+    def __render(accepted, bucketlist_id):
+        # load the saved items back by id, or by name for new ones
+        keys = [key for _, key in accepted]
+        saved = {}
+        for item in BucketListItem.query.filter(
+                BucketListItem.bucketlist_id == bucketlist_id, or_(
+                    BucketListItem.id.in_(
+                        [key for key in keys if isinstance(key, int)]),
+                    BucketListItem.name.in_(
+                        [key for key in keys if isinstance(key, str)]))):
+            saved[item.id] = saved[item.name] = item.as_dict()
+        for result, key in accepted:
+            result['item'] = saved.get(key)
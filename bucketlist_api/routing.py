@@ -0,0 +1,166 @@
+from contextlib import contextmanager
+from itertools import count
+from threading import Lock
+import time
+
+from flask import g, has_app_context
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, orm, text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.sql.dml import UpdateBase
+
+
+class Replica(object):
+    '''
+    A read-only copy of the database. It is checked with
+    REPLICA_HEALTH_QUERY at most every REPLICA_HEALTH_INTERVAL seconds,
+    and taken out of rotation until the next check when a check or a
+    query on it fails.
+    '''
+
+    def __init__(self, uri, config):
+        self.uri = uri
+        self.config = config
+        self.engine = create_engine(uri)
+        self.healthy = True
+        self.checked = 0
+        event.listen(self.engine, 'handle_error', self.failed)
+
+    def available(self):
+        if time.time() - self.checked >= self.config[
+                'REPLICA_HEALTH_INTERVAL']:
+            self.check()
+        return self.healthy
+
+    def check(self):
+        try:
+            with self.engine.connect() as connection:
+                connection.execute(text(self.config['REPLICA_HEALTH_QUERY']))
+            self.healthy = True
+        except SQLAlchemyError:
+            self.healthy = False
+        self.checked = time.time()
+
+    def failed(self, context):
+        # handle_error listener, an unusable replica waits for a check
+        if isinstance(context.sqlalchemy_exception, OperationalError):
+            self.healthy = False
+            self.checked = time.time()
+
+
+class RoutingSession(SignallingSession):
+    '''
+    Sends the reads of a request in replica_reads to a replica, and its
+    writes, and every read after its first write, to the primary
+    '''
+
+    def __init__(self, db, **options):
+        self.db = db
+        super(RoutingSession, self).__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            wrote()
+        elif reading_from_replica():
+            engine = self.db.replica_engine()
+            if engine is not None:
+                return engine
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    '''
+    Flask-SQLAlchemy with read replicas from SQLALCHEMY_REPLICA_URIS,
+    picked round robin among the healthy ones. Without replicas, or with
+    none healthy, everything goes to SQLALCHEMY_DATABASE_URI.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self._replicas = ((), [])
+        self._turn = count()
+        self._lock = Lock()
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+        super(RoutingSQLAlchemy, self).__init__(*args, **kwargs)
+
+    def init_app(self, app):
+        super(RoutingSQLAlchemy, self).init_app(app)
+        app.before_request(start_request)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def replicas(self):
+        # the replicas of the configured URIs, rebuilt when they change
+        app = self.get_app()
+        uris = tuple(app.config.get('SQLALCHEMY_REPLICA_URIS') or ())
+        with self._lock:
+            if self._replicas[0] != uris:
+                for replica in self._replicas[1]:
+                    replica.engine.dispose()
+                self._replicas = (uris, [Replica(uri, app.config)
+                                         for uri in uris])
+            return self._replicas[1]
+
+    def replica_engine(self):
+        # the replica of the current request, the same for all its reads
+        if 'db_replica' not in g:
+            replicas = self.replicas()
+            g.db_replica = None
+            for _ in range(len(replicas)):
+                replica = replicas[next(self._turn) % len(replicas)]
+                if replica.available():
+                    g.db_replica = replica
+                    break
+            else:
+                if replicas:
+                    self.primary_fallbacks += 1
+        replica = g.db_replica
+        if replica is None or not replica.healthy:
+            return None
+        self.replica_reads += 1
+        g.db_replica_read = True
+        return replica.engine
+
+    def replica_stats(self):
+        return {'reads': self.replica_reads,
+                'primary_fallbacks': self.primary_fallbacks,
+                'healthy': sum(replica.healthy
+                               for replica in self._replicas[1])}
+
+
+def start_request():
+    # routing state is per request, even when requests share a context
+    for key in ('replica_reads', 'db_wrote', 'db_replica', 'db_replica_read'):
+        g.pop(key, None)
+
+
+@contextmanager
+def replica_reads():
+    # route the reads in the block to a replica, until the request writes
+    if not has_app_context():
+        yield
+        return
+    previous = g.get('replica_reads', False)
+    g.replica_reads = True
+    try:
+        yield
+    finally:
+        g.replica_reads = previous
+
+
+def reading_from_replica():
+    return has_app_context() and g.get('replica_reads', False) and not (
+        g.get('db_wrote', False))
+
+
+def read_from_replica():
+    # whether a read of the request went to a replica, which may lag
+    # behind the primary
+    return has_app_context() and g.get('db_replica_read', False)
+
+
+def wrote():
+    # later reads of the request must see the write, on the primary
+    if has_app_context():
+        g.db_wrote = True
@@ -0,0 +1,118 @@
+import re
+
+from sqlalchemy import event, false, text
+
+from bucketlist_api import app, db
+from bucketlist_api.models import BucketList
+
+# bucketlists are indexed under even rowids and items under odd ones,
+# so triggers can find the index row of any bucketlist or item by key.
+CREATE_SEARCH_INDEX = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        name, owner UNINDEXED, bucketlist_id UNINDEXED)''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_search_insert
+        AFTER INSERT ON bucket_list BEGIN
+        INSERT INTO search_index(rowid, name, owner, bucketlist_id)
+        VALUES (new.id * 2, new.name, new.created_by, new.id);
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_search_update
+        AFTER UPDATE OF name ON bucket_list BEGIN
+        UPDATE search_index SET name = new.name WHERE rowid = new.id * 2;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_search_delete
+        AFTER DELETE ON bucket_list BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 2;
+        DELETE FROM search_index WHERE rowid IN (
+            SELECT id * 2 + 1 FROM bucket_list_item
+            WHERE bucketlist_id = old.id);
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_item_search_insert
+        AFTER INSERT ON bucket_list_item BEGIN
+        INSERT INTO search_index(rowid, name, owner, bucketlist_id)
+        SELECT new.id * 2 + 1, new.name, created_by, id
+        FROM bucket_list WHERE id = new.bucketlist_id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_item_search_update
+        AFTER UPDATE OF name ON bucket_list_item BEGIN
+        UPDATE search_index SET name = new.name
+        WHERE rowid = new.id * 2 + 1;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_item_search_delete
+        AFTER DELETE ON bucket_list_item BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 2 + 1;
+        END''',
+]
+
+DROP_SEARCH_INDEX = [
+    'DROP TRIGGER IF EXISTS bucket_list_search_insert',
+    'DROP TRIGGER IF EXISTS bucket_list_search_update',
+    'DROP TRIGGER IF EXISTS bucket_list_search_delete',
+    'DROP TRIGGER IF EXISTS bucket_list_item_search_insert',
+    'DROP TRIGGER IF EXISTS bucket_list_item_search_update',
+    'DROP TRIGGER IF EXISTS bucket_list_item_search_delete',
+    'DROP TABLE IF EXISTS search_index',
+]
+
+POPULATE_SEARCH_INDEX = [
+    '''INSERT INTO search_index(rowid, name, owner, bucketlist_id)
+        SELECT id * 2, name, created_by, id FROM bucket_list''',
+    '''INSERT INTO search_index(rowid, name, owner, bucketlist_id)
+        SELECT item.id * 2 + 1, item.name, bucket_list.created_by,
+            bucket_list.id
+        FROM bucket_list_item AS item
+        JOIN bucket_list ON bucket_list.id = item.bucketlist_id''',
+]
+
+# best rank of each of the owner's bucketlists matching on its own
+# name or on the name of one of its items
+SEARCH_HITS = '''SELECT bucketlist_id, min(rank) AS rank FROM search_index
+    WHERE search_index MATCH :query AND owner = :owner
+    GROUP BY bucketlist_id'''
+
+
+def search_enabled(connection):
+    # the index is only kept on SQLite databases
+    return app.config.get('FULL_TEXT_SEARCH') and (
+        connection.dialect.name == 'sqlite')
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(metadata, connection, **kw):
+    if search_enabled(connection):
+        for statement in CREATE_SEARCH_INDEX:
+            connection.execute(statement)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(metadata, connection, **kw):
+    if search_enabled(connection):
+        for statement in DROP_SEARCH_INDEX:
+            connection.execute(statement)
+
+
+def rebuild_search_index():
+    # recreate the index and its triggers from the bucketlist tables
+    with db.engine.begin() as connection:
+        for statement in (DROP_SEARCH_INDEX + CREATE_SEARCH_INDEX +
+                          POPULATE_SEARCH_INDEX):
+            connection.execute(statement)
+
+
+def match_expression(search_name):
+    # quote every word so user input is never parsed as FTS5 syntax
+    words = re.findall(r'\w+', search_name)
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+def search_bucketlists(bucketlists, owner, search_name):
+    # restrict bucketlists to the owner's best matches, best ranked first
+    if not search_enabled(db.engine):
+        return bucketlists.filter(
+            BucketList.name.ilike("%{}%".format(search_name.title())))
+    query = match_expression(search_name)
+    if not query:
+        return bucketlists.filter(false())
+    hits = text(SEARCH_HITS).bindparams(query=query, owner=owner).columns(
+        bucketlist_id=db.Integer, rank=db.Float).alias('hits')
+    return bucketlists.join(
+        hits, hits.c.bucketlist_id == BucketList.id).order_by(hits.c.rank)
@@ -0,0 +1,68 @@
+import random
+
+from bucketlist_api import db
+from bucketlist_api.models import User, password_hasher
+from bucketlist_api.transfer import insert_chunk
+
+WORDS = ('visit', 'learn', 'climb', 'build', 'write', 'cook', 'paint', 'sail',
+         'run', 'read', 'mountain', 'river', 'guitar', 'novel', 'garden',
+         'island', 'marathon', 'language', 'desert', 'festival', 'city',
+         'ocean', 'bridge', 'forest', 'museum', 'kitchen', 'temple', 'canyon')
+
+
+def seed_usernames(users, prefix='seed'):
+    # the usernames of seed_database, as registration stores them
+    return ['{}{}'.format(prefix, number).title()
+            for number in range(1, users + 1)]
+
+
+def seed_database(users, bucketlists, items, seed=0, password='password',
+                  prefix='seed', chunk_size=500):
+    # create users x bucketlists x items for load tests. The same
+    # arguments give the same names, item states and passwords. Every
+    # user shares one password hash so seeding costs a single hash.
+    # returns (users, bucketlists, items) created
+    usernames = seed_usernames(users, prefix)
+    if seeded_users(prefix, usernames):
+        raise ValueError('seed users with prefix {} exist'.format(prefix))
+    password_hash = password_hasher.hash(password)
+    if usernames:
+        db.session.execute(User.__table__.insert(), [
+            {'username': username, 'password_hash': password_hash}
+            for username in usernames])
+        db.session.commit()
+    owners = seeded_users(prefix, usernames)
+    rng = random.Random(seed)
+    totals = {'bucketlists': 0, 'items': 0}
+    errors = []
+    chunk = []
+    for owner in owners:
+        for number in range(1, bucketlists + 1):
+            chunk.append((number, (
+                {'name': seed_name(rng, number), 'created_by': owner},
+                [{'name': seed_name(rng, item), 'done': rng.random() < 0.3}
+                 for item in range(1, items + 1)])))
+            if len(chunk) >= chunk_size:
+                insert_chunk(chunk, totals, errors)
+                chunk = []
+    if chunk:
+        insert_chunk(chunk, totals, errors)
+    if errors:
+        raise ValueError(errors[0][1])
+    return len(owners), totals['bucketlists'], totals['items']
+
+
+def seeded_users(prefix, usernames):
+    # ids of the users named in usernames, by a prefix match since an IN
+    # list of every username can exceed the SQLite variable limit
+    usernames = set(usernames)
+    return [user_id for user_id, username in db.session.query(
+        User.id, User.username).filter(
+        User.username.like(prefix.title() + '%')).order_by(User.id)
+        if username in usernames]
+
+
+def seed_name(rng, number):
+    # searchable words, unique within the parent by the trailing number
+    return '{} {} {}'.format(
+        rng.choice(WORDS), rng.choice(WORDS), number).title()
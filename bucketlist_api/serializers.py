@@ -0,0 +1,74 @@
+from functools import lru_cache
+from json import dumps
+from operator import attrgetter
+
+from flask import current_app, make_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def compile_serializer(fields, passed=()):
+    # return a function rendering an object as a dict of the str() of its
+    # fields, in order. Fields in passed are arguments of the function, in
+    # the order of passed, and are used as they are. One attrgetter reads
+    # all the attributes, so rendering a row is a single zip instead of a
+    # loop over the table columns, e.g. for ('id', 'items') and
+    # passed=('items',): serialize(obj, items) -> {'id': str(obj.id), ...}
+    for field in fields:
+        if not field.isidentifier():
+            raise ValueError('invalid field name {!r}'.format(field))
+    keys = tuple(field for field in fields if field not in passed)
+    getter = attrgetter(*keys) if keys else lambda obj: ()
+    read = (lambda obj: (getter(obj),)) if len(keys) == 1 else getter
+    if keys == tuple(fields):
+        def serialize(obj, *arguments, keys=keys, read=read, str=str):
+            return dict(zip(keys, map(str, read(obj))))
+        return serialize
+    # the positions of the fields among the read values and the arguments
+    order = tuple(len(keys) + passed.index(field) if field in passed else
+                  keys.index(field) for field in fields)
+
+    def serialize_passed(obj, *arguments):
+        values = tuple(map(str, read(obj))) + arguments
+        return dict(zip(fields, [values[index] for index in order]))
+    return serialize_passed
+
+
+@lru_cache(maxsize=256)
+def cached_serializer(fields, passed=()):
+    # compile_serializer for the field tuples picked per request, e.g.
+    # by fields=, each compiled once
+    return compile_serializer(fields, passed)
+
+
+def fast_dumps(data):
+    # encode with orjson or ujson when installed, else the json module
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS) + b'\n'
+    if ujson is not None:
+        return ujson.dumps(data, escape_forward_slashes=False) + '\n'
+    return dumps(data) + '\n'
+
+
+def output_json(data, code, headers=None):
+    # flask_restful representation of application/json. RESTFUL_JSON
+    # settings and debug mode (indented, sorted keys) keep the json module
+    settings = current_app.config.get('RESTFUL_JSON', {})
+    if settings or current_app.debug:
+        settings = dict(settings)
+        if current_app.debug:
+            settings.setdefault('indent', 4)
+            settings.setdefault('sort_keys', True)
+        dumped = dumps(data, **settings) + '\n'
+    else:
+        dumped = fast_dumps(data)
+    response = make_response(dumped, code)
+    response.headers.extend(headers or {})
+    return response
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+import math
+from threading import Lock
+import time
+
+from flask import g, jsonify, request
+
+from bucketlist_api import app
+from bucketlist_api.models import User
+
+
+class TokenBucket(object):
+    '''
+    Allows bursts of capacity requests, refilled at rate per second
+    '''
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.time()
+
+    def take(self):
+        # return 0 when a token was taken, else the seconds until one is
+        now = time.time()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Throttle(object):
+    '''
+    Admission control in front of every request.
+
+    RATE_LIMITS maps an endpoint to (burst, requests per second) and
+    RATE_LIMIT_DEFAULT applies to the other endpoints; None disables
+    it. Buckets are kept per user, or per client IP for requests
+    without a valid token, taken from X-Forwarded-For behind the
+    PROXY_FIX_HOPS trusted proxies. Over the limit a request gets a 429.
+    MAX_CONCURRENT_REQUESTS caps the requests in progress in the
+    process; over it requests are shed with a 503 instead of queueing.
+    '''
+
+    def __init__(self, config, max_buckets=100000):
+        self.config = config
+        self.max_buckets = max_buckets
+        self.buckets = OrderedDict()
+        self.active = 0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.shed = 0
+        self._lock = Lock()
+
+    def admit(self):
+        # before_request hook, returns the rejection response if any
+        cap = self.config.get('MAX_CONCURRENT_REQUESTS')
+        limit = self.config.get('RATE_LIMITS', {}).get(
+            request.endpoint, self.config.get('RATE_LIMIT_DEFAULT'))
+        key = self.__client_key() if limit and request.endpoint else None
+        with self._lock:
+            if cap is not None and self.active >= cap:
+                self.shed += 1
+                return self.__reject(
+                    503, 'Server is busy, try again later', 1)
+            if key is not None:
+                retry_after = self.__bucket(key, limit).take()
+                if retry_after:
+                    self.rate_limited += 1
+                    return self.__reject(
+                        429, 'Too many requests, slow down', retry_after)
+            self.active += 1
+            self.admitted += 1
+            g.throttle_admitted = True
+
+    def release(self, exception=None):
+        # teardown_request hook for admitted requests
+        if g.pop('throttle_admitted', False):
+            with self._lock:
+                self.active -= 1
+
+    def stats(self):
+        return {'admitted': self.admitted, 'rate_limited': self.rate_limited,
+                'shed': self.shed, 'active': self.active}
+
+    def __bucket(self, key, limit):
+        # the least recently used buckets go first past max_buckets
+        bucket = self.buckets.pop(key, None) or TokenBucket(*limit)
+        self.buckets[key] = bucket
+        if len(self.buckets) > self.max_buckets:
+            self.buckets.popitem(last=False)
+        return bucket
+
+    @staticmethod
+    def __client_key():
+        token = request.headers.get('Token')
+        try:
+            principal = User.load_principal(token) if token else None
+        except ValueError:
+            principal = None
+        if principal:
+            return request.endpoint, 'user', principal.id
+        return request.endpoint, 'ip', request.remote_addr
+
+    @staticmethod
+    def __reject(status, message, retry_after):
+        response = jsonify(message=message)
+        response.status_code = status
+        response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
+        return response
+
+
+throttle = Throttle(app.config)
@@ -0,0 +1,174 @@
+from collections import OrderedDict
+import json
+
+from sqlalchemy import and_, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from bucketlist_api import db
+from bucketlist_api.cache import response_cache
+from bucketlist_api.models import BucketList, BucketListItem
+
+
+def export_bucketlists(owner, batch_size=1000):
+    # yield a json line per bucketlist of the owner, with its items, in
+    # the shape of as_dict. Rows stream from one ordered outer join in
+    # batches of batch_size so memory stays flat for any account size.
+    rows = db.session.query(
+        BucketList.id, BucketList.name, BucketList.date_created,
+        BucketList.date_modified, BucketList.created_by,
+        BucketListItem.id.label('item_id'),
+        BucketListItem.name.label('item_name'), BucketListItem.done,
+        BucketListItem.date_created.label('item_date_created'),
+        BucketListItem.date_modified.label('item_date_modified')).outerjoin(
+        BucketListItem, BucketListItem.bucketlist_id == BucketList.id).filter(
+        BucketList.created_by == owner, ~BucketList.deleted).order_by(
+        BucketList.id, BucketListItem.id).yield_per(batch_size)
+    bucketlist = None
+    for row in rows:
+        if bucketlist is None or bucketlist['id'] != str(row.id):
+            if bucketlist is not None:
+                yield json.dumps(bucketlist) + '\n'
+            bucketlist = OrderedDict([
+                ('id', str(row.id)),
+                ('name', str(row.name)),
+                ('items', []),
+                ('date_created', str(row.date_created)),
+                ('date_modified', str(row.date_modified)),
+                ('created_by', str(row.created_by))
+            ])
+        if row.item_id is not None:
+            bucketlist['items'].append({
+                'id': str(row.item_id),
+                'date_created': str(row.item_date_created),
+                'date_modified': str(row.item_date_modified),
+                'done': str(row.done),
+                'name': str(row.item_name)
+            })
+    if bucketlist is not None:
+        yield json.dumps(bucketlist) + '\n'
+
+
+def import_bucketlists(lines, owner=None, chunk_size=500, progress=None):
+    # insert NDJSON bucketlists with nested items, as written by
+    # export_bucketlists, one transaction per chunk of chunk_size lines.
+    # owner overrides the created_by of every line. progress is called
+    # after each chunk with the line number and the totals so far.
+    # returns (bucketlists, items, errors), errors as (line, message).
+    totals = {'bucketlists': 0, 'items': 0}
+    errors = []
+    chunk = []
+    line_number = 0
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            chunk.append((line_number, parse_bucketlist(line, owner)))
+        except ValueError as error:
+            errors.append((line_number, str(error)))
+        if len(chunk) >= chunk_size:
+            insert_chunk(chunk, totals, errors)
+            chunk = []
+            if progress:
+                progress(line_number, totals['bucketlists'], totals['items'])
+    if chunk:
+        insert_chunk(chunk, totals, errors)
+    if progress:
+        progress(line_number, totals['bucketlists'], totals['items'])
+    return totals['bucketlists'], totals['items'], errors
+
+
+def parse_bucketlist(line, owner=None):
+    # validate one line and return the bucketlist row and its item rows,
+    # names checked and title cased like the API does
+    try:
+        data = json.loads(line)
+    except ValueError:
+        raise ValueError('invalid json')
+    if not isinstance(data, dict) or not str(data.get('name', '')).strip():
+        raise ValueError('bucketlist name is required')
+    name = str(data['name']).strip().title()
+    if len(name) < 10:
+        raise ValueError('bucketlist name must be at least 10 characters')
+    try:
+        created_by = int(owner or data['created_by'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('created_by is required without an owner')
+    items = data.get('items') or []
+    if not isinstance(items, list) or not all(
+            isinstance(item, dict) and str(item.get('name', '')).strip()
+            for item in items):
+        raise ValueError('every item needs a name')
+    item_names = [str(item['name']).strip().title() for item in items]
+    if not all(len(item_name) > 10 for item_name in item_names):
+        raise ValueError('item names must be at least 11 characters')
+    if len(set(item_names)) < len(item_names):
+        raise ValueError('item names must be unique in a bucketlist')
+    return ({'name': name, 'created_by': created_by},
+            [{'name': item_name,
+              'done': item.get('done') in (True, 'True', 'true', 1)}
+             for item_name, item in zip(item_names, items)])
+
+
+def insert_chunk(chunk, totals, errors):
+    # lines naming a live bucketlist of their owner are reported and the
+    # rest go in as one transaction. Should a constraint still fail, a
+    # name taken meanwhile or an unknown owner, the chunk is retried line
+    # by line so only the offending lines are reported.
+    chunk = skip_taken_names(chunk, errors)
+    if not chunk:
+        return
+    try:
+        insert_lines(chunk, totals)
+    except IntegrityError:
+        for line in chunk:
+            try:
+                insert_lines([line], totals)
+            except SQLAlchemyError as error:
+                errors.append((line[0], 'not imported: {}'.format(
+                    getattr(error, 'orig', error))))
+    except SQLAlchemyError as error:
+        errors.append((chunk[0][0], 'lines {}-{} not imported: {}'.format(
+            chunk[0][0], chunk[-1][0], error.__class__.__name__)))
+
+
+def skip_taken_names(chunk, errors):
+    # return the lines of chunk whose (owner, name) is neither live in the
+    # database nor on an earlier line, one query for the whole chunk
+    table = BucketList.__table__
+    bucketlists = [bucketlist for _, (bucketlist, _) in chunk]
+    taken = {tuple(row) for row in db.engine.execute(select(
+        [table.c.created_by, table.c.name]).where(and_(
+            table.c.created_by.in_({row['created_by'] for row in bucketlists}),
+            table.c.name.in_({row['name'] for row in bucketlists}),
+            ~table.c.deleted)))}
+    lines = []
+    for line in chunk:
+        bucketlist = line[1][0]
+        key = (bucketlist['created_by'], bucketlist['name'])
+        if key in taken:
+            errors.append((line[0], 'bucketlist name already exists'))
+            continue
+        taken.add(key)
+        lines.append(line)
+    return lines
+
+
+def insert_lines(lines, totals):
+    # each bucketlist insert returns the id its items need, then all the
+    # items of the lines go in as one executemany before a single commit
+    bucketlist_table = BucketList.__table__
+    item_table = BucketListItem.__table__
+    with db.engine.begin() as connection:
+        items = []
+        for _, (bucketlist, bucketlist_items) in lines:
+            bucketlist_id = connection.execute(
+                bucketlist_table.insert(), bucketlist
+            ).inserted_primary_key[0]
+            items.extend(dict(item, bucketlist_id=bucketlist_id)
+                         for item in bucketlist_items)
+        if items:
+            connection.execute(item_table.insert(), items)
+    totals['bucketlists'] += len(lines)
+    totals['items'] += len(items)
+    for owner in {bucketlist['created_by'] for _, (bucketlist, _) in lines}:
+        response_cache.invalidate(owner)
@@ -1,8 +1,17 @@
 # from bucketlist import db
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
+from hashlib import sha1
+
+from flask import request, Response
 from flask_restful import abort
+from sqlalchemy.exc import IntegrityError
+from werkzeug.http import quote_etag
 from webargs import fields, validate
 
 from bucketlist_api import db
+from bucketlist_api.cache import invalidate_user_responses
+from bucketlist_api.database import is_lock_error
 
 
 user_reg_login_field = {
@@ -19,19 +28,132 @@ name_done_field = {
     'done': fields.Bool()
 }
 
+item_batch_field = {
+    'items': fields.List(fields.Nested({
+        'id': fields.Int(),
+        'name': fields.Str(),
+        'done': fields.Bool()
+    }), required=True, validate=validate.Length(1, 1000))
+}
+
+# selects the items of a bucketlist for the bulk operations, all given
+# filters must match: item ids (ids=1,2,3), done and a name prefix
+item_filter_field = {
+    'ids': fields.DelimitedList(fields.Int(),
+                                validate=validate.Length(1, 1000)),
+    'done': fields.Bool(),
+    'prefix': fields.Str(validate=validate.Length(1))
+}
+
+# changes to every selected item, rename_prefix replaces the prefix filter
+item_bulk_update_field = {
+    'done': fields.Bool(),
+    'rename_prefix': fields.Str(validate=validate.Length(1))
+}
+
 limit_field = {
     'limit': fields.Int(),
     'page': fields.Int(),
-    'q': fields.String()
+    'q': fields.String(),
+    'cursor': fields.String(),
+    'include_items': fields.String(),
+    'fields': fields.String()
 }
 
 
-def save(obj):
-    # adds a valid instance to the session
+# a page of the items of a bucketlist, filtered like the bulk operations
+item_page_field = dict(item_filter_field, limit=fields.Int(),
+                       cursor=fields.String(), fields=fields.String())
+
+
+def page_limit(args, default=20, maximum=100):
+    # the page size of a read, at most maximum. A limit below 1 would make
+    # the keyset pages empty or skip rows, it is rejected
+    limit = args.pop('limit', default)
+    if limit < 1:
+        abort(400, message='limit must be at least 1')
+    return min(limit, maximum)
+
+
+def save(obj, conflict_message='Request cannot be handled now'):
+    # adds a valid instance to the session, a unique constraint
+    # violation is reported with conflict_message
     try:
         db.session.add(obj)
         db.session.commit()
+        invalidate_user_responses()
         return True
-    except Exception:
+    except IntegrityError:
+        db.session.rollback()
+        abort(400, message=conflict_message)
+    except Exception as error:
+        if is_lock_error(error):
+            raise  # retried by retry_on_lock
         db.session.rollback()
         abort(400, message='Request cannot be handled now')
+
+
+def encode_cursor(last_id):
+    # an opaque keyset pagination cursor for the last id on a page
+    return urlsafe_b64encode(str(last_id).encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    # return the id a cursor points after, None for the first page
+    if not cursor:
+        return None
+    try:
+        return int(urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError):
+        abort(400, message='invalid pagination cursor')
+
+
+def include_items(value, max_items=100):
+    # parse include_items of a bucketlist read: true (the default) for
+    # every item, false for none, count for items_count only, first:N for
+    # the first N items. Returns (mode, N)
+    if value is None or value == 'true':
+        return 'all', None
+    elif value in ('false', 'count'):
+        return value, None
+    mode, _, number = value.partition(':')
+    if mode == 'first' and number.isdigit() and int(number) <= max_items:
+        return mode, int(number)
+    abort(400, message='include_items must be true, false, count or'
+          ' first:N with N at most {}'.format(max_items))
+
+
+def sparse_fields(value, allowed, item_fields=()):
+    # parse fields=, a comma separated subset of allowed, where items.name
+    # picks a field of the nested items. Returns (fields, item fields) in
+    # the order of allowed and item_fields, None for every field
+    if value is None:
+        return None, None
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    items = [name[len('items.'):] for name in names
+             if name.startswith('items.')]
+    names = [name for name in names if not name.startswith('items.')]
+    if items:
+        names.append('items')
+    if not names or not set(names) <= set(allowed) or not (
+            set(items) <= set(item_fields)):
+        abort(400, message='fields must be a comma separated list of {}'
+              .format(', '.join(allowed + tuple(
+                  'items.' + field for field in item_fields))))
+    return (tuple(field for field in allowed if field in names),
+            tuple(field for field in item_fields if field in items) or None)
+
+
+def make_etag(*state):
+    # a strong entity tag for a response built from the given row state
+    return sha1(repr(state).encode('utf-8')).hexdigest()
+
+
+def etag_header(etag):
+    return {'ETag': quote_etag(etag)}
+
+
+def not_modified(etag):
+    # a bodiless 304 when the client already holds this version
+    if etag in request.if_none_match:
+        return Response(status=304, headers=etag_header(etag))
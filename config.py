@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -11,9 +12,88 @@ class BaseConfig(object):
     '''
     SECRET_KEY = os.getenv('SECRET_KEY', 'This should be changed')
     SQLALCHEMY_DATABASE_URI = os.getenv(
-        'DATABASE_URI', "'sqlite:///' + {}".format(MAIN_DB_URL))
+        'DATABASE_URI', 'sqlite:///' + MAIN_DB_URL)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # read-only copies of the database for the bucketlist reads and token
+    # lookups, comma separated in DATABASE_REPLICA_URIS. A replica failing
+    # REPLICA_HEALTH_QUERY is skipped for REPLICA_HEALTH_INTERVAL seconds.
+    SQLALCHEMY_REPLICA_URIS = [
+        uri for uri in os.getenv('DATABASE_REPLICA_URIS', '').split(',')
+        if uri]
+    REPLICA_HEALTH_INTERVAL = 5
+    REPLICA_HEALTH_QUERY = 'SELECT 1'
     ERROR_404_HELP = False
+    # token lookups cached per worker. A change to a user reaches the other
+    # workers through the generations of a shared response cache backend
+    # ('sqlite'), else only once PRINCIPAL_CACHE_TTL seconds have passed
+    PRINCIPAL_CACHE_SIZE = 10000
+    PRINCIPAL_CACHE_TTL = 300
+    FULL_TEXT_SEARCH = True
+    # response cache backend: 'memory' (single process), 'sqlite' (shared
+    # by the workers on a host) or None to disable it
+    RESPONSE_CACHE_BACKEND = None
+    RESPONSE_CACHE_SIZE = 10000
+    RESPONSE_CACHE_TTL = 60
+    # it holds every user's responses: kept next to the app, readable by
+    # its user only, never in a shared directory like /tmp
+    RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH', os.path.join(
+        BASE_DIR, 'response_cache.sqlite'))
+    EXPORT_BATCH_SIZE = 1000
+    # sha512_crypt cost, hashes made at another cost are updated on login
+    PASSWORD_HASH_ROUNDS = 656000
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_QUEUE = 32
+    # (burst, requests per second) per user or client IP, by endpoint
+    RATE_LIMITS = {
+        'userregapi': (5, 0.1),
+        'userloginapi': (10, 0.5)
+    }
+    RATE_LIMIT_DEFAULT = (100, 20)
+    # the reverse proxies in front of the server that append the client
+    # address to X-Forwarded-For. 0 keys anonymous rate limits on the peer
+    # address, which behind a proxy is the proxy's; more than the real
+    # count lets a client pick its address by sending the header
+    PROXY_FIX_HOPS = int(os.getenv('PROXY_FIX_HOPS', 0))
+    MAX_CONCURRENT_REQUESTS = 64
+    # a directory shared by the workers on a host so /metrics covers all
+    # of them, None reports the serving process only
+    METRICS_DIR = os.getenv('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = 1
+    # applied to every SQLite connection, WAL lets readers run alongside
+    # the writer and busy_timeout (ms) waits for locks instead of failing
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'foreign_keys': 'ON'
+    }
+    # requests failing on a lock past busy_timeout are run again after
+    # a jittered backoff (seconds) before they get a 503
+    SQLITE_LOCK_RETRIES = 3
+    SQLITE_LOCK_BACKOFF = 0.05
+    SQLITE_LOCK_BACKOFF_MAX = 1.0
+    # gunicorn, see server.py. SERVER_WORKER_CLASS is 'sync', 'threaded'
+    # (SERVER_THREADS per worker) or 'gevent' (SERVER_WORKER_CONNECTIONS)
+    SERVER_HOST = os.getenv('HOST', '0.0.0.0')
+    SERVER_WORKERS = int(os.getenv(
+        'WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+    SERVER_WORKER_CLASS = os.getenv('WORKER_CLASS', 'threaded')
+    SERVER_THREADS = 4
+    SERVER_WORKER_CONNECTIONS = 1000
+    # workers are replaced gracefully after this many requests, jittered
+    # so they do not restart together
+    SERVER_MAX_REQUESTS = 10000
+    SERVER_MAX_REQUESTS_JITTER = 1000
+    SERVER_KEEPALIVE = 5
+    SERVER_TIMEOUT = 30
+    SERVER_GRACEFUL_TIMEOUT = 30
+    # deleted bucketlists are purged by the gunicorn master every
+    # RECLAIM_INTERVAL seconds (None to leave it to manage.py reclaim),
+    # RECLAIM_BATCH_SIZE rows per transaction
+    RECLAIM_INTERVAL = 60
+    RECLAIM_BATCH_SIZE = 1000
+    # aiosqlite connections of the asyncio read server, bucketlist_api.aio
+    AIO_CONNECTIONS = 4
     DEBUG = False
     TESTING = False
 
@@ -25,6 +105,8 @@ class DevelopmentConfig(BaseConfig):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + MAIN_DB_URL
     DEBUG = True
     DEVELOPMENT = True
+    RESPONSE_CACHE_BACKEND = 'memory'
+    PASSWORD_HASH_ROUNDS = 5000
 
 
 class TestingConfig(BaseConfig):
@@ -34,6 +116,12 @@ class TestingConfig(BaseConfig):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + TEST_DB_URL
     CSRF_ENABLED = False
+    PASSWORD_HASH_ROUNDS = 1000
+    PASSWORD_HASH_WORKERS = 0
+    RATE_LIMITS = {}
+    RATE_LIMIT_DEFAULT = None
+    MAX_CONCURRENT_REQUESTS = None
+    SQLITE_PRAGMAS = {'busy_timeout': 5000, 'foreign_keys': 'ON'}
 
 
 class StagingConfig(BaseConfig):
@@ -46,3 +134,7 @@ class ProductionConfig(BaseConfig):
     config for when in production
     '''
     DEBUG = False
+    RESPONSE_CACHE_BACKEND = 'sqlite'
+    # 64MB page cache per connection and 256MB of the file memory mapped
+    SQLITE_PRAGMAS = dict(BaseConfig.SQLITE_PRAGMAS, cache_size=-64000,
+                          mmap_size=268435456)
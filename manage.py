@@ -1,17 +1,89 @@
+import os
+import sys
+
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
-from bucketlist_api import db
+from bucketlist_api import db, transfer
 from bucketlist_api.app import app
+from bucketlist_api.models import User
+from bucketlist_api.reclaimer import reclaim_deleted
+from bucketlist_api.search import rebuild_search_index
+from bucketlist_api.seed import seed_database
 
-app.config.from_object('config.DevelopmentConfig')
+app.config.from_object(os.getenv('APP_SETTINGS', 'config.DevelopmentConfig'))
 app.config.from_envvar('BUCKETLIST_SETTINGS', silent=True)
 
-migrate = Migrate(app, db)
+# SQLite alters tables by copying them, autogenerate writes batch operations
+migrate = Migrate(app, db, render_as_batch=True)
 manager = Manager(app)
 
 manager.add_command('db', MigrateCommand)
 
 
+@manager.command
+def rebuild_index():
+    '''Recreate the full-text search index of bucketlist and item names'''
+    rebuild_search_index()
+
+
+@manager.option('path', help='NDJSON file to read, - for standard input')
+@manager.option('-u', '--user', dest='username', default=None,
+                help='owner of every bucketlist instead of its created_by')
+@manager.option('-c', '--chunk-size', dest='chunk_size', type=int,
+                default=500, help='bucketlists inserted per transaction')
+def import_bucketlists(path, username=None, chunk_size=500):
+    '''Import bucketlists and their items from an NDJSON export'''
+    owner = None
+    if username:
+        user = User.query.filter_by(username=username.strip().title()).first()
+        if not user:
+            sys.exit('user {} does not exist'.format(username))
+        owner = user.id
+
+    def progress(line_number, bucketlists, items):
+        print('line {}: {} bucketlists and {} items imported'.format(
+            line_number, bucketlists, items), file=sys.stderr)
+
+    lines = sys.stdin if path == '-' else open(path)
+    with lines:
+        bucketlists, items, errors = transfer.import_bucketlists(
+            lines, owner, chunk_size, progress)
+    for line_number, message in errors:
+        print('line {}: {}'.format(line_number, message), file=sys.stderr)
+    print('imported {} bucketlists and {} items, {} errors'.format(
+        bucketlists, items, len(errors)))
+
+
+@manager.option('-n', '--users', dest='users', type=int, default=10)
+@manager.option('-b', '--bucketlists', dest='bucketlists', type=int,
+                default=10, help='bucketlists per user')
+@manager.option('-i', '--items', dest='items', type=int, default=10,
+                help='items per bucketlist')
+@manager.option('-s', '--seed', dest='seed', type=int, default=0,
+                help='random seed, the same seed gives the same data')
+@manager.option('-p', '--password', dest='password', default='password')
+@manager.option('--prefix', dest='prefix', default='seed',
+                help='usernames are the prefix and a number, e.g. Seed1')
+def seed(users=10, bucketlists=10, items=10, seed=0, password='password',
+         prefix='seed'):
+    '''Create users with bucketlists and items for load tests'''
+    try:
+        created = seed_database(users, bucketlists, items, seed, password,
+                                prefix)
+    except ValueError as error:
+        sys.exit(str(error))
+    print('seeded {} users, {} bucketlists and {} items'.format(*created))
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                default=None, help='rows deleted per transaction')
+def reclaim(batch_size=None):
+    '''Purge deleted bucketlists and their items'''
+    totals = reclaim_deleted(batch_size)
+    print('purged {bucketlists} bucketlists and {items} items'.format(
+        **totals))
+
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,60 @@
+"""the user, bucket_list and bucket_list_item tables
+
+Revision ID: 2127636bfdec
+Revises:
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2127636bfdec'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases made with db.create_all before there were migrations have
+    # these tables already, only the missing ones are created
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'user' not in tables:
+        op.create_table(
+            'user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('date_created', sa.DateTime(timezone=True)),
+            sa.Column('date_modified', sa.DateTime(timezone=True)),
+            sa.Column('username', sa.String(length=256), nullable=False),
+            sa.Column('password_hash', sa.String(length=256),
+                      nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('username'))
+    if 'bucket_list' not in tables:
+        op.create_table(
+            'bucket_list',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('date_created', sa.DateTime(timezone=True)),
+            sa.Column('date_modified', sa.DateTime(timezone=True)),
+            sa.Column('created_by', sa.Integer()),
+            sa.Column('name', sa.String(length=256)),
+            sa.ForeignKeyConstraint(['created_by'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'))
+    if 'bucket_list_item' not in tables:
+        op.create_table(
+            'bucket_list_item',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('date_created', sa.DateTime(timezone=True)),
+            sa.Column('date_modified', sa.DateTime(timezone=True)),
+            sa.Column('done', sa.Boolean()),
+            sa.Column('name', sa.String(length=256)),
+            sa.Column('bucketlist_id', sa.Integer()),
+            sa.ForeignKeyConstraint(['bucketlist_id'], ['bucket_list.id']),
+            sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade():
+    op.drop_table('bucket_list_item')
+    op.drop_table('bucket_list')
+    op.drop_table('user')
@@ -0,0 +1,42 @@
+"""names unique per user and per bucketlist
+
+Revision ID: 60cd4ebabc90
+Revises: 2127636bfdec
+Create Date: 2026-10-18 16:10:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '60cd4ebabc90'
+down_revision = '2127636bfdec'
+branch_labels = None
+depends_on = None
+
+# the rows sharing a name in their scope, but the first, get their id
+# appended, e.g. 'Learn Python (12)', so no row is lost to the constraint
+RENAME_DUPLICATES = '''UPDATE {table} SET name = name || ' (' || id || ')'
+    WHERE name IS NOT NULL AND id NOT IN (
+        SELECT min(id) FROM {table} GROUP BY {scope}, name)'''
+
+
+def upgrade():
+    op.execute(RENAME_DUPLICATES.format(
+        table='bucket_list', scope='created_by'))
+    op.execute(RENAME_DUPLICATES.format(
+        table='bucket_list_item', scope='bucketlist_id'))
+    op.create_index('uq_bucket_list_created_by_name', 'bucket_list',
+                    ['created_by', 'name'], unique=True)
+    # SQLite cannot add a constraint to a table, batch mode copies it
+    with op.batch_alter_table('bucket_list_item') as batch:
+        batch.create_unique_constraint(
+            'uq_bucket_list_item_bucketlist_id_name',
+            ['bucketlist_id', 'name'])
+
+
+def downgrade():
+    with op.batch_alter_table('bucket_list_item') as batch:
+        batch.drop_constraint(
+            'uq_bucket_list_item_bucketlist_id_name', type_='unique')
+    op.drop_index('uq_bucket_list_created_by_name', 'bucket_list')
@@ -0,0 +1,58 @@
+"""soft deleted bucketlists, versions and cascading item deletes
+
+Revision ID: 760d7c60e804
+Revises: 60cd4ebabc90
+Create Date: 2026-10-18 16:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '760d7c60e804'
+down_revision = '60cd4ebabc90'
+branch_labels = None
+depends_on = None
+
+# names the unnamed foreign key of the baseline so batch mode can drop it
+NAMING_CONVENTION = {
+    'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+ITEM_BUCKETLIST_FK = 'fk_bucket_list_item_bucketlist_id_bucket_list'
+
+
+def upgrade():
+    op.add_column('bucket_list', sa.Column(
+        'deleted', sa.Boolean(), nullable=False, server_default='0'))
+    op.add_column('bucket_list', sa.Column(
+        'version', sa.Integer(), nullable=False, server_default='0'))
+    # a deleted name can be reused before the reclaimer purges it
+    op.drop_index('uq_bucket_list_created_by_name', 'bucket_list')
+    op.create_index('uq_bucket_list_created_by_name', 'bucket_list',
+                    ['created_by', 'name'], unique=True,
+                    sqlite_where=sa.text('deleted = 0'),
+                    postgresql_where=sa.text('NOT deleted'))
+    # the items the old query.delete() left behind, then the cascade that
+    # keeps bucketlists from leaving any again
+    op.execute('DELETE FROM bucket_list_item WHERE bucketlist_id NOT IN '
+               '(SELECT id FROM bucket_list)')
+    with op.batch_alter_table('bucket_list_item',
+                              naming_convention=NAMING_CONVENTION) as batch:
+        batch.drop_constraint(ITEM_BUCKETLIST_FK, type_='foreignkey')
+        batch.create_foreign_key(ITEM_BUCKETLIST_FK, 'bucket_list',
+                                 ['bucketlist_id'], ['id'],
+                                 ondelete='CASCADE')
+
+
+def downgrade():
+    with op.batch_alter_table('bucket_list_item') as batch:
+        batch.drop_constraint(ITEM_BUCKETLIST_FK, type_='foreignkey')
+        batch.create_foreign_key(ITEM_BUCKETLIST_FK, 'bucket_list',
+                                 ['bucketlist_id'], ['id'])
+    op.drop_index('uq_bucket_list_created_by_name', 'bucket_list')
+    op.execute('DELETE FROM bucket_list WHERE deleted')
+    op.create_index('uq_bucket_list_created_by_name', 'bucket_list',
+                    ['created_by', 'name'], unique=True)
+    with op.batch_alter_table('bucket_list') as batch:
+        batch.drop_column('version')
+        batch.drop_column('deleted')
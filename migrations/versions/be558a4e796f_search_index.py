@@ -0,0 +1,90 @@
+"""full-text search index of bucketlist and item names
+
+Revision ID: be558a4e796f
+Revises: 760d7c60e804
+Create Date: 2026-10-18 16:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'be558a4e796f'
+down_revision = '760d7c60e804'
+branch_labels = None
+depends_on = None
+
+# bucketlist_api.search as of this revision: bucketlists are indexed under
+# even rowids and items under odd ones, triggers keep the index in sync
+CREATE_SEARCH_INDEX = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        name, owner UNINDEXED, bucketlist_id UNINDEXED)''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_search_insert
+        AFTER INSERT ON bucket_list BEGIN
+        INSERT INTO search_index(rowid, name, owner, bucketlist_id)
+        VALUES (new.id * 2, new.name, new.created_by, new.id);
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_search_update
+        AFTER UPDATE OF name ON bucket_list BEGIN
+        UPDATE search_index SET name = new.name WHERE rowid = new.id * 2;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_search_delete
+        AFTER DELETE ON bucket_list BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 2;
+        DELETE FROM search_index WHERE rowid IN (
+            SELECT id * 2 + 1 FROM bucket_list_item
+            WHERE bucketlist_id = old.id);
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_item_search_insert
+        AFTER INSERT ON bucket_list_item BEGIN
+        INSERT INTO search_index(rowid, name, owner, bucketlist_id)
+        SELECT new.id * 2 + 1, new.name, created_by, id
+        FROM bucket_list WHERE id = new.bucketlist_id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_item_search_update
+        AFTER UPDATE OF name ON bucket_list_item BEGIN
+        UPDATE search_index SET name = new.name
+        WHERE rowid = new.id * 2 + 1;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS bucket_list_item_search_delete
+        AFTER DELETE ON bucket_list_item BEGIN
+        DELETE FROM search_index WHERE rowid = old.id * 2 + 1;
+        END''',
+]
+
+POPULATE_SEARCH_INDEX = [
+    '''INSERT INTO search_index(rowid, name, owner, bucketlist_id)
+        SELECT id * 2, name, created_by, id FROM bucket_list''',
+    '''INSERT INTO search_index(rowid, name, owner, bucketlist_id)
+        SELECT item.id * 2 + 1, item.name, bucket_list.created_by,
+            bucket_list.id
+        FROM bucket_list_item AS item
+        JOIN bucket_list ON bucket_list.id = item.bucketlist_id''',
+]
+
+DROP_SEARCH_INDEX = [
+    'DROP TRIGGER IF EXISTS bucket_list_search_insert',
+    'DROP TRIGGER IF EXISTS bucket_list_search_update',
+    'DROP TRIGGER IF EXISTS bucket_list_search_delete',
+    'DROP TRIGGER IF EXISTS bucket_list_item_search_insert',
+    'DROP TRIGGER IF EXISTS bucket_list_item_search_update',
+    'DROP TRIGGER IF EXISTS bucket_list_item_search_delete',
+    'DROP TABLE IF EXISTS search_index',
+]
+
+
+def upgrade():
+    # the index is only kept on SQLite, the lists and items made before
+    # it are indexed right away
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in (DROP_SEARCH_INDEX + CREATE_SEARCH_INDEX +
+                      POPULATE_SEARCH_INDEX):
+        op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in DROP_SEARCH_INDEX:
+        op.execute(statement)
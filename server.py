@@ -1,8 +1,126 @@
+'''
+Serve the API on gunicorn with the SERVER_* settings of the config.
+
+    $ python server.py          # gunicorn, preloaded and warmed up
+    $ python server.py --dev    # Werkzeug's reloading development server
+
+gunicorn runs config.ProductionConfig unless APP_SETTINGS names another
+config class, --dev runs config.DevelopmentConfig.
+'''
+import glob
 import os
+import sys
+
+# the config is loaded when bucketlist_api is imported, pick it first
+os.environ.setdefault('APP_SETTINGS', 'config.DevelopmentConfig' if (
+    '--dev' in sys.argv) else 'config.ProductionConfig')
 
-from bucketlist_api.app import app
+from gunicorn.app.base import BaseApplication  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import configure_mappers  # noqa: E402
+from sqlalchemy.pool import NullPool  # noqa: E402
+
+from bucketlist_api import db  # noqa: E402
+from bucketlist_api.app import app  # noqa: E402
+from bucketlist_api.cache import response_cache  # noqa: E402
+from bucketlist_api.reclaimer import Reclaimer  # noqa: E402
+from bucketlist_api.serializers import fast_dumps  # noqa: E402
 
 PORT = int(os.getenv('PORT', 5000))
 
+# SERVER_WORKER_CLASS values and the gunicorn workers they run
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'threaded': 'gthread',
+    'gevent': 'gevent'
+}
+
+
+class Server(BaseApplication):
+    '''
+    gunicorn running the app object of this process, so it is imported
+    once in the master (preload) and the workers fork with it loaded
+    '''
+
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super(Server, self).__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def server_options(config):
+    # gunicorn settings from the app config
+    worker_class = config['SERVER_WORKER_CLASS']
+    if worker_class not in WORKER_CLASSES:
+        raise ValueError('SERVER_WORKER_CLASS must be one of {}'.format(
+            ', '.join(sorted(WORKER_CLASSES))))
+    if config['SERVER_WORKERS'] > 1 and config.get(
+            'RESPONSE_CACHE_BACKEND') == 'memory':
+        # a write in one worker would not invalidate the others' caches,
+        # which would serve stale reads until RESPONSE_CACHE_TTL
+        raise ValueError('RESPONSE_CACHE_BACKEND memory is per process, use'
+                         ' sqlite (or None) with more than one worker')
+    return {
+        'bind': '{}:{}'.format(config['SERVER_HOST'], PORT),
+        'workers': config['SERVER_WORKERS'],
+        'worker_class': WORKER_CLASSES[worker_class],
+        # gunicorn turns sync workers with threads into threaded ones
+        'threads': config['SERVER_THREADS'] if (
+            worker_class == 'threaded') else 1,
+        'worker_connections': config['SERVER_WORKER_CONNECTIONS'],
+        'max_requests': config['SERVER_MAX_REQUESTS'],
+        'max_requests_jitter': config['SERVER_MAX_REQUESTS_JITTER'],
+        'keepalive': config['SERVER_KEEPALIVE'],
+        'timeout': config['SERVER_TIMEOUT'],
+        'graceful_timeout': config['SERVER_GRACEFUL_TIMEOUT'],
+        'preload_app': True,
+        'on_starting': on_starting,
+        'when_ready': start_reclaimer,
+        'post_fork': warm_up
+    }
+
+
+def on_starting(server):
+    # configure the mappers once in the master for every worker, and drop
+    # the metrics snapshots of the workers of a previous run
+    configure_mappers()
+    directory = app.config.get('METRICS_DIR')
+    if directory:
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            os.remove(path)
+
+
+def start_reclaimer(server):
+    # one reclaimer in the master purges deleted bucketlists for all the
+    # workers. Its engine keeps no connection between batches, so the
+    # workers forked later inherit none
+    if app.config.get('RECLAIM_INTERVAL'):
+        Reclaimer(engine=create_engine(
+            app.config['SQLALCHEMY_DATABASE_URI'], poolclass=NullPool)).start()
+
+
+def warm_up(server, worker):
+    # a worker must not share the master's connections, it opens its own
+    # and primes the caches before taking its first request
+    with app.app_context():
+        db.engine.dispose()
+        db.session.execute('SELECT 1')
+        db.session.remove()
+        # builds the cache backend, a SQLite one connects lazily in each
+        # request thread
+        response_cache.backend
+        fast_dumps({'warm': [1]})
+
 
-app.run()
+if __name__ == '__main__':
+    if '--dev' in sys.argv:
+        app.run(port=PORT)
+    else:
+        Server(app, server_options(app.config)).run()
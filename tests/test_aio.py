@@ -0,0 +1,90 @@
+import asyncio
+import json
+import unittest
+from flask_testing import TestCase
+
+from tests import app, db
+
+try:
+    from aiohttp.test_utils import TestClient, TestServer
+    from bucketlist_api.aio import create_app
+except ImportError:
+    create_app = None
+
+
+@unittest.skipIf(create_app is None, 'aiohttp and aiosqlite not installed')
+class TestAsyncReads(TestCase):
+    '''
+    The asyncio read server answers GETs like the Flask resources
+    '''
+
+    def create_app(self):
+        app.config.from_object('config.TestingConfig')
+        return app
+
+    def setUp(self):
+        self.app = self.create_app().test_client()
+        db.drop_all()
+        db.create_all()
+        user = {'username': 'marcus', 'password': 'polymath'}
+        self.app.post('/api/v1/auth/register', data=user)
+        self.token = json.loads(self.app.post(
+            '/api/v1/auth/login', data=user).data).get('token')
+        for name in ('Before I Am Thirty', 'Before I Am Forty'):
+            self.app.post('/api/v1/bucketlists/', data={'name': name},
+                          headers={'Token': self.token})
+        self.app.post('/api/v1/bucketlists/1/items/',
+                      data={'name': 'Visit Rome'},
+                      headers={'Token': self.token})
+
+    def tearDown(self):
+        db.session.remove()
+
+    def fetch_async(self, urls, token):
+        async def fetch():
+            client = TestClient(TestServer(create_app(app.config)))
+            await client.start_server()
+            try:
+                responses = []
+                for url in urls:
+                    response = await client.get(url, headers={'Token': token})
+                    responses.append((response.status, await response.json()))
+                return responses
+            finally:
+                await client.close()
+        return asyncio.run(fetch())
+
+    def test_reads_match_the_flask_resources(self):
+        urls = ['/api/v1/bucketlists/1', '/api/v1/bucketlists?limit=1',
+                '/api/v1/bucketlists?limit=1&cursor=MQ',
+                '/api/v1/bucketlists?q=rome', '/api/v1/bucketlists/9',
+                '/api/v1/bucketlists?limit=1&include_items=false',
+                '/api/v1/bucketlists?include_items=count',
+                '/api/v1/bucketlists/1?include_items=first:0',
+                '/api/v1/bucketlists/1?include_items=all',
+                '/api/v1/bucketlists?limit=1&fields=id,name,items.name',
+                '/api/v1/bucketlists/1?fields=name,items&include_items=count',
+                '/api/v1/bucketlists?fields=nope',
+                '/api/v1/bucketlists?limit=-1&cursor=']
+        expected = []
+        for url in urls:
+            response = self.app.get(url, headers={'Token': self.token})
+            body = json.loads(response.data)
+            expected.append((response.status_code, body))
+        responses = self.fetch_async(urls, self.token)
+        for (status, body), (flask_status, flask_body) in zip(
+                responses, expected):
+            assert status == flask_status
+            if isinstance(body, dict):
+                for link in ('next_page', 'previous_page'):
+                    if body.get(link):
+                        body[link] = body[link].split('/api/v1/')[1]
+                        flask_body[link] = flask_body[link].split(
+                            '/api/v1/')[1]
+            assert body == flask_body
+
+    def test_invalid_token_rejected(self):
+        [(status, body)] = self.fetch_async(
+            ['/api/v1/bucketlists'], 'not a token')
+        assert status == 401
+        assert body == {'message': 'You have supplied an Invalid TOKEN'}
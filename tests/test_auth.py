@@ -1,5 +1,6 @@
 from flask_testing import TestCase
 import json
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from tests import app, config, db, User
 
@@ -90,6 +91,57 @@ class TestRegLogin(TestCase):
         # json.loads(resp.data)
         assert resp.status_code == 404
 
+    def test_user_login_with_wrong_password(self):
+        req = ({'username': 'Adebayo', 'password': 'andela007'})
+        self.app.post(self.reg_url, data=req)
+        req['password'] = 'andela008'
+        resp = self.app.post(self.login_url, data=req)
+        assert resp.status_code == 404
+
+    def test_password_rehashed_on_login_when_cost_changes(self):
+        req = ({'username': 'Adebayo', 'password': 'andela007'})
+        app.config['PASSWORD_HASH_WORKERS'] = 1
+        self.app.post(self.reg_url, data=req)
+        assert '$rounds=1000$' in User.query.get(1).password_hash
+        app.config['PASSWORD_HASH_ROUNDS'] = 2000
+        resp = self.app.post(self.login_url, data=req)
+        assert resp.status_code == 200
+        assert '$rounds=2000$' in User.query.get(1).password_hash
+
+    def test_login_rate_limited_per_client(self):
+        req = ({'username': 'Adebayo', 'password': 'andela007'})
+        self.app.post(self.reg_url, data=req)
+        app.config['RATE_LIMITS'] = {'userloginapi': (2, 0.01)}
+        for _ in range(2):
+            assert self.app.post(self.login_url, data=req).status_code == 200
+        resp = self.app.post(self.login_url, data=req)
+        assert resp.status_code == 429
+        assert int(resp.headers['Retry-After']) > 0
+        assert self.app.get('/').status_code == 200
+
+    def test_login_rate_limited_per_forwarded_client(self):
+        req = ({'username': 'Adebayo', 'password': 'andela007'})
+        self.app.post(self.reg_url, data=req)
+        app.config['RATE_LIMITS'] = {'userloginapi': (1, 0.01)}
+        wsgi_app = app.wsgi_app
+        app.wsgi_app = ProxyFix(wsgi_app, x_for=1)
+        try:
+            for client, status in (('10.0.0.1', 200), ('10.0.0.2', 200),
+                                   ('1.2.3.4, 10.0.0.1', 429)):
+                resp = self.app.post(
+                    self.login_url, data=req,
+                    headers={'X-Forwarded-For': client},
+                    environ_base={'REMOTE_ADDR': '192.168.0.1'})
+                assert resp.status_code == status
+        finally:
+            app.wsgi_app = wsgi_app
+
+    def test_requests_shed_over_concurrency_cap(self):
+        app.config['MAX_CONCURRENT_REQUESTS'] = 0
+        resp = self.app.get('/')
+        assert resp.status_code == 503
+        assert resp.headers['Retry-After'] == '1'
+
     def test_user_can_access_auth_routes(self):
         #
         req = ({'username': 'Adebayo', 'password': 'andela007'})
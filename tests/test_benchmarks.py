@@ -0,0 +1,47 @@
+import json
+import os
+import tempfile
+from flask_testing import TestCase
+from unittest import mock
+
+from benchmarks import micro
+from tests import app, db
+
+
+class TestMicroBenchmarks(TestCase):
+    '''
+    Every micro benchmark runs against the current code, so the
+    regression gate of benchmarks/micro.py cannot silently break
+    '''
+
+    def create_app(self):
+        app.config.from_object('config.TestingConfig')
+        return app
+
+    def setUp(self):
+        db.drop_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def test_gate_fails_on_a_regression(self):
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        with open(path, 'w') as baseline:
+            json.dump({'item_as_dict': {'seconds': 1e-6, 'relative': 1.0}},
+                      baseline)
+        arguments = ['--baseline', path, '--retries', '0']
+        for relative, extra, status in ((1.2, [], 0), (2.0, [], 1),
+                                        (2.0, ['--advisory'], 0)):
+            result = {'item_as_dict': {'seconds': 1e-6,
+                                       'relative': relative}}
+            with mock.patch.object(micro, 'run', return_value=result):
+                assert micro.main(arguments + extra) == status
+
+    def test_benchmarks_run(self):
+        with app.test_request_context():
+            for function, calibration in micro.benchmarks().values():
+                function()
+                calibration()
@@ -0,0 +1,187 @@
+import json
+import os
+import shutil
+import stat
+import tempfile
+import time
+from unittest import mock
+from flask_testing import TestCase
+from sqlalchemy import event
+
+from tests import app, db, User
+from bucketlist_api.cache import LRUCache, SQLiteBackend, response_cache
+from bucketlist_api.models import principal_cache
+
+
+class TestLRUCache(TestCase):
+    '''
+    The bounded in-process cache used for principals
+    '''
+
+    def create_app(self):
+        app.config.from_object('config.TestingConfig')
+        return app
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1 and cache.get('c') == 3
+        assert cache.stats() == {'hits': 3, 'misses': 1, 'size': 2}
+
+    def test_entries_expire(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1, expires=time.time() - 1)
+        assert cache.get('a') is None
+        cache.discard_where(lambda value: True)
+        assert cache.stats()['size'] == 0
+
+
+class TestPrincipalCache(TestCase):
+    '''
+    verify_token should not hit the database for a known token
+    '''
+
+    def create_app(self):
+        app.config.from_object('config.TestingConfig')
+        return app
+
+    def setUp(self):
+        self.app = self.create_app().test_client()
+        db.drop_all()
+        db.create_all()
+        principal_cache.clear()
+        user = {'username': 'marcus', 'password': 'polymath'}
+        self.app.post('/api/v1/auth/register', data=user)
+        self.token = json.loads(self.app.post(
+            '/api/v1/auth/login', data=user).data).get('token')
+
+    def tearDown(self):
+        db.session.remove()
+
+    def user_queries(self):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if 'FROM user' in statement:
+                statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.app.get('/api/v1/bucketlists/',
+                         headers={'Token': self.token})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return len(statements)
+
+    def test_principal_cached_until_user_changes(self):
+        assert self.user_queries() == 1
+        assert self.user_queries() == 0
+        assert principal_cache.stats()['hits'] == 1
+        user = User.query.get(1)
+        user.username = 'Marcus Aurelius'
+        db.session.commit()
+        assert self.user_queries() == 1
+
+    def test_principal_invalidated_by_another_worker(self):
+        handle, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        app.config['RESPONSE_CACHE_BACKEND'] = 'sqlite'
+        app.config['RESPONSE_CACHE_PATH'] = path
+        self.addCleanup(app.config.update, RESPONSE_CACHE_BACKEND=None)
+        assert self.user_queries() == 1
+        assert self.user_queries() == 0
+        # the user changed in a worker sharing the cache file
+        SQLiteBackend(path, 10, 60).bump(1)
+        assert self.user_queries() == 1
+        assert self.user_queries() == 0
+
+
+class TestSQLiteBackendFile(TestCase):
+    '''
+    The cache file holds every user's responses and stays private
+    '''
+
+    def create_app(self):
+        app.config.from_object('config.TestingConfig')
+        return app
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'cache.sqlite')
+
+    def test_created_private(self):
+        SQLiteBackend(self.path, 10, 60).bump(1)
+        for name in (self.path, self.path + '-wal', self.path + '-shm'):
+            if os.path.exists(name):
+                assert stat.S_IMODE(os.stat(name).st_mode) == 0o600
+        with open(self.path, 'a'):
+            os.chmod(self.path, 0o644)
+        SQLiteBackend(self.path, 10, 60)
+        assert stat.S_IMODE(os.stat(self.path).st_mode) == 0o600
+
+    def test_refuses_files_of_other_users(self):
+        open(self.path, 'w').close()
+        with mock.patch('os.geteuid', return_value=os.geteuid() + 1):
+            with self.assertRaises(PermissionError):
+                SQLiteBackend(self.path, 10, 60)
+        os.remove(self.path)
+        os.symlink(self.path + '.elsewhere', self.path)
+        with self.assertRaises(PermissionError):
+            SQLiteBackend(self.path, 10, 60)
+
+
+class TestResponseCache(TestCase):
+    '''
+    Repeated reads come from the cache until the user writes
+    '''
+
+    def create_app(self):
+        app.config.from_object('config.TestingConfig')
+        return app
+
+    def setUp(self):
+        self.app = self.create_app().test_client()
+        db.drop_all()
+        db.create_all()
+        user = {'username': 'marcus', 'password': 'polymath'}
+        self.app.post('/api/v1/auth/register', data=user)
+        self.token = json.loads(self.app.post(
+            '/api/v1/auth/login', data=user).data).get('token')
+        self.app.post('/api/v1/bucketlists/', data={'name': 'Before I Am 50'},
+                      headers={'Token': self.token})
+
+    def tearDown(self):
+        app.config['RESPONSE_CACHE_BACKEND'] = None
+        db.session.remove()
+
+    def read_write_read(self):
+        url = '/api/v1/bucketlists/1'
+        first = self.app.get(url, headers={'Token': self.token})
+        second = self.app.get(url, headers={'Token': self.token})
+        assert first.data == second.data
+        assert second.headers['ETag'] == first.headers['ETag']
+        assert response_cache.stats()['hits'] == 1
+        self.app.put(url, data={'name': 'Before I Am 60'},
+                     headers={'Token': self.token})
+        third = self.app.get(url, headers={'Token': self.token})
+        assert json.loads(third.data)['name'] == 'Before I Am 60'
+        assert response_cache.stats()['hit_rate'] == 1 / 3
+
+    def test_memory_backend(self):
+        app.config['RESPONSE_CACHE_BACKEND'] = 'memory'
+        self.read_write_read()
+
+    def test_sqlite_backend(self):
+        handle, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(handle)
+        app.config['RESPONSE_CACHE_BACKEND'] = 'sqlite'
+        app.config['RESPONSE_CACHE_PATH'] = path
+        try:
+            self.read_write_read()
+        finally:
+            os.unlink(path)
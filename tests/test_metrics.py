@@ -0,0 +1,60 @@
+import json
+import os
+import shutil
+import tempfile
+from flask_testing import TestCase
+
+from tests import app, db
+from bucketlist_api.metrics import Metrics, metrics
+
+
+class TestMetrics(TestCase):
+    '''
+    /metrics reports request latency, status codes and database use
+    '''
+
+    def create_app(self):
+        app.config.from_object('config.TestingConfig')
+        return app
+
+    def setUp(self):
+        self.app = self.create_app().test_client()
+        db.drop_all()
+        db.create_all()
+        user = {'username': 'marcus', 'password': 'polymath'}
+        self.app.post('/api/v1/auth/register', data=user)
+        self.token = json.loads(self.app.post(
+            '/api/v1/auth/login', data=user).data).get('token')
+
+    def tearDown(self):
+        db.session.remove()
+
+    def test_requests_and_queries_are_reported(self):
+        self.app.get('/api/v1/bucketlists/', headers={'Token': self.token})
+        resp = self.app.get('/metrics')
+        assert resp.status_code == 200
+        assert resp.mimetype == 'text/plain'
+        text = resp.data.decode()
+        assert ('bucketlist_requests_total{endpoint="bucketlistapi",'
+                'method="GET",status="404"}') in text
+        assert ('bucketlist_request_duration_seconds_bucket{'
+                'endpoint="userloginapi",le="+Inf"}') in text
+        assert ('bucketlist_db_queries_per_request_count'
+                '{endpoint="bucketlistapi"}') in text
+        assert 'bucketlist_db_queries_total ' in text
+        assert 'bucketlist_cache_hits{cache="principal"}' in text
+
+    def test_workers_aggregated_through_metrics_dir(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        config = dict(app.config, METRICS_DIR=directory)
+        worker = Metrics(config)
+        worker.inc('bucketlist_requests_total', (('status', '200'),), 2)
+        worker.flush(force=True)
+        os.rename(os.path.join(directory, '{}.json'.format(os.getpid())),
+                  os.path.join(directory, 'other.json'))
+        host = Metrics(config)
+        host.inc('bucketlist_requests_total', (('status', '200'),), 3)
+        text = host.render()
+        assert 'bucketlist_requests_total{status="200"} 5.0' in text
+        assert metrics.render() != text
@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from flask_migrate import Migrate, upgrade
+from flask_testing import TestCase
+
+from tests import app, db, User
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'migrations')
+
+# the tables as db.create_all made them before there were migrations
+BASELINE_SCHEMA = '''
+CREATE TABLE user (
+    id INTEGER NOT NULL, date_created DATETIME, date_modified DATETIME,
+    username VARCHAR(256) NOT NULL, password_hash VARCHAR(256) NOT NULL,
+    PRIMARY KEY (id), UNIQUE (username));
+CREATE TABLE bucket_list (
+    id INTEGER NOT NULL, date_created DATETIME, date_modified DATETIME,
+    created_by INTEGER, name VARCHAR(256), PRIMARY KEY (id),
+    FOREIGN KEY(created_by) REFERENCES user (id));
+CREATE TABLE bucket_list_item (
+    id INTEGER NOT NULL, date_created DATETIME, date_modified DATETIME,
+    done BOOLEAN, name VARCHAR(256), bucketlist_id INTEGER,
+    PRIMARY KEY (id), CHECK (done IN (0, 1)),
+    FOREIGN KEY(bucketlist_id) REFERENCES bucket_list (id));
+INSERT INTO user VALUES (1, NULL, NULL, 'Marcus', 'hash');
+INSERT INTO bucket_list VALUES (1, NULL, NULL, 1, 'Before I Am Thirty');
+INSERT INTO bucket_list VALUES (2, NULL, NULL, 1, 'Before I Am Thirty');
+INSERT INTO bucket_list_item VALUES (1, NULL, NULL, 0, 'Learn Italian', 1);
+INSERT INTO bucket_list_item VALUES (2, NULL, NULL, 1, 'Learn Italian', 1);
+INSERT INTO bucket_list_item VALUES (3, NULL, NULL, 0, 'Learn Italian', 2);
+INSERT INTO bucket_list_item VALUES (4, NULL, NULL, 0, 'Orphaned Item', 9);
+'''
+
+
+class TestMigrations(TestCase):
+    '''
+    The migrations bring a database made before them up to the models
+    '''
+
+    def create_app(self):
+        app.config.from_object('config.TestingConfig')
+        return app
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'baseline.sqlite')
+        connection = sqlite3.connect(self.path)
+        connection.executescript(BASELINE_SCHEMA)
+        connection.close()
+        Migrate(app, db, directory=MIGRATIONS, render_as_batch=True)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.path
+
+    def tearDown(self):
+        db.session.remove()
+        app.config.from_object('config.TestingConfig')
+
+    def query(self, statement):
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute(statement).fetchall()
+        finally:
+            connection.close()
+
+    def test_duplicate_names_renamed_then_unique(self):
+        upgrade(MIGRATIONS, '60cd4ebabc90')
+        assert self.query('SELECT id, name FROM bucket_list') == [
+            (1, 'Before I Am Thirty'), (2, 'Before I Am Thirty (2)')]
+        assert self.query('SELECT id, name, bucketlist_id FROM '
+                          'bucket_list_item') == [
+            (1, 'Learn Italian', 1), (2, 'Learn Italian (2)', 1),
+            (3, 'Learn Italian', 2), (4, 'Orphaned Item', 9)]
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.query("INSERT INTO bucket_list_item (name, bucketlist_id) "
+                       "VALUES ('Learn Italian', 2)")
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.query("INSERT INTO bucket_list (name, created_by) "
+                       "VALUES ('Before I Am Thirty', 1)")
+
+    def test_soft_delete_columns_and_cascade(self):
+        upgrade(MIGRATIONS, '760d7c60e804')
+        assert self.query('SELECT id FROM bucket_list_item') == [
+            (1,), (2,), (3,)]
+        assert self.query('SELECT deleted, version FROM bucket_list') == [
+            (0, 0), (0, 0)]
+        connection = sqlite3.connect(self.path)
+        connection.execute('PRAGMA foreign_keys=ON')
+        connection.execute('UPDATE bucket_list SET deleted = 1 WHERE id = 2')
+        # the name of a deleted list is free
+        connection.execute("INSERT INTO bucket_list (name, created_by) "
+                           "VALUES ('Before I Am Thirty (2)', 1)")
+        connection.execute('DELETE FROM bucket_list WHERE id = 1')
+        connection.commit()
+        connection.close()
+        assert self.query('SELECT id FROM bucket_list_item') == [(3,)]
+
+    def test_search_index_built_from_existing_names(self):
+        upgrade(MIGRATIONS)
+        token = User.query.get(1).generate_auth_token()
+        res = app.test_client().get('/api/v1/bucketlists?q=italian',
+                                    headers={'Token': token})
+        assert res.status_code == 200
+        assert [bucketlist['id'] for bucketlist in json.loads(
+            res.data)['data'].values()] == ['1', '2']
@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from flask_testing import TestCase
+
+from tests import app, config, db
+from bucketlist_api.cache import response_cache
+
+
+class TestReadReplicas(TestCase):
+    '''
+    Bucketlist reads go to a replica, writes and reads after a write to
+    the primary, and an unhealthy replica falls back to the primary
+    '''
+
+    def create_app(self):
+        app.config.from_object('config.TestingConfig')
+        return app
+
+    def setUp(self):
+        self.app = self.create_app().test_client()
+        db.drop_all()
+        db.create_all()
+        user = {'username': 'marcus', 'password': 'polymath'}
+        self.app.post('/api/v1/auth/register', data=user)
+        self.token = json.loads(self.app.post(
+            '/api/v1/auth/login', data=user).data).get('token')
+        self.app.post('/api/v1/bucketlists/',
+                      data={'name': 'Before I Am Thirty'},
+                      headers={'Token': self.token})
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.replica = os.path.join(directory, 'replica.sqlite')
+        shutil.copy(config.TEST_DB_URL, self.replica)
+        replica = sqlite3.connect(self.replica)
+        replica.execute(
+            "UPDATE bucket_list SET name = 'From The Replica' WHERE id = 1")
+        replica.commit()
+        replica.close()
+
+    def tearDown(self):
+        db.session.remove()
+        app.config['SQLALCHEMY_REPLICA_URIS'] = []
+        db.replicas()
+
+    def get_name(self):
+        return json.loads(self.app.get(
+            '/api/v1/bucketlists/1', headers={'Token': self.token}).data)[
+            'name']
+
+    def test_reads_routed_to_replica_writes_to_primary(self):
+        assert self.get_name() == 'Before I Am Thirty'
+        db.session.remove()  # the test's context outlives the requests
+        app.config['SQLALCHEMY_REPLICA_URIS'] = ['sqlite:///' + self.replica]
+        assert self.get_name() == 'From The Replica'
+        res = self.app.put('/api/v1/bucketlists/1',
+                           data={'name': 'Before I Am Forty'},
+                           headers={'Token': self.token})
+        assert json.loads(res.data)['name'] == 'Before I Am Forty'
+        assert db.replica_stats()['reads'] > 0
+
+    def test_replica_reads_not_cached(self):
+        app.config['RESPONSE_CACHE_BACKEND'] = 'memory'
+        self.addCleanup(app.config.update, RESPONSE_CACHE_BACKEND=None)
+        db.session.remove()
+        app.config['SQLALCHEMY_REPLICA_URIS'] = ['sqlite:///' + self.replica]
+        assert self.get_name() == 'From The Replica'
+        assert self.get_name() == 'From The Replica'
+        assert response_cache.stats()['hits'] == 0
+        app.config['SQLALCHEMY_REPLICA_URIS'] = []
+        assert self.get_name() == 'Before I Am Thirty'
+        assert self.get_name() == 'Before I Am Thirty'
+        assert response_cache.stats()['hits'] == 1
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        app.config['SQLALCHEMY_REPLICA_URIS'] = [
+            'sqlite:///' + os.path.join(self.replica, 'missing.sqlite')]
+        fallbacks = db.replica_stats()['primary_fallbacks']
+        assert self.get_name() == 'Before I Am Thirty'
+        assert db.replica_stats()['primary_fallbacks'] == fallbacks + 1
+        assert db.replica_stats()['healthy'] == 0
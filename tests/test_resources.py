@@ -1,6 +1,10 @@
 import json
+import sqlite3
+import threading
 from flask_testing import TestCase
+from sqlalchemy import event
 
+from bucketlist_api.reclaimer import reclaim_deleted
 from tests import config, app, db, BucketList, BucketListItem
 
 
@@ -148,6 +152,106 @@ class BucketListResource(TestCase):
             '/api/v1/bucketlists/1', data=req, headers={'Token': token})
         assert res.status_code == 400
 
+    def test_get_bucketlists_with_cursor(self):
+        self.reg_user()
+        token = self.login_user()
+        for name in ('Before January', 'Before February', 'Before March'):
+            self.app.post(
+                self.bucketlist_url, data={'name': name},
+                headers={'Token': token})
+        res = self.app.get(
+            self.bucketlist_url + '?limit=2&cursor=', headers={'Token': token})
+        assert res.status_code == 200
+        page = json.loads(res.data)
+        assert list(page['data']) == ['Bucketlist1', 'Bucketlist2']
+        assert 'pages' not in page
+        res = self.app.get(
+            self.bucketlist_url + '?limit=2&cursor=' + page['next_cursor'],
+            headers={'Token': token})
+        page = json.loads(res.data)
+        assert list(page['data']) == ['Bucketlist3']
+        assert page['next_cursor'] is None
+        res = self.app.get(
+            self.bucketlist_url + '?cursor=not-a-cursor',
+            headers={'Token': token})
+        assert res.status_code == 400
+        for limit in ('0', '-1'):
+            res = self.app.get(
+                self.bucketlist_url + '?cursor=&limit=' + limit,
+                headers={'Token': token})
+            assert res.status_code == 400
+
+    def test_writes_retried_while_database_is_locked(self):
+        self.reg_user()
+        token = self.login_user()
+        bucketlist = {'name': 'Before the end of the Year'}
+        app.config.update(SQLITE_PRAGMAS={'busy_timeout': 1},
+                          SQLITE_LOCK_RETRIES=0)
+        db.session.remove()
+        db.engine.dispose()  # connect again with the short busy_timeout
+        self.addCleanup(db.engine.dispose)
+        locker = sqlite3.connect(config.TEST_DB_URL, isolation_level=None,
+                                 check_same_thread=False)
+        self.addCleanup(locker.close)
+        locker.execute('BEGIN IMMEDIATE')
+        res = self.app.post(self.bucketlist_url, data=bucketlist,
+                            headers={'Token': token})
+        assert res.status_code == 503
+        app.config.update(SQLITE_LOCK_RETRIES=10, SQLITE_LOCK_BACKOFF=0.05)
+        threading.Timer(0.1, locker.execute, ['COMMIT']).start()
+        res = self.app.post(self.bucketlist_url, data=bucketlist,
+                            headers={'Token': token})
+        assert res.status_code == 201
+
+    def test_bucketlist_names_unique_per_user(self):
+        req = {'name': 'Before January'}
+        self.reg_user()
+        token = self.login_user()
+        self.app.post(self.bucketlist_url, data=req, headers={'Token': token})
+        self.req = {'username': 'aurelius', 'password': 'polymath'}
+        self.reg_user()
+        other_token = self.login_user()
+        res = self.app.post(
+            self.bucketlist_url, data=req, headers={'Token': other_token})
+        assert res.status_code == 201
+        res = self.app.post(
+            self.bucketlist_url, data=req, headers={'Token': other_token})
+        assert res.status_code == 400
+        assert 'Bucket List name already exists' in (
+            json.loads(res.data)).get('message')
+        res = self.app.put('/api/v1/bucketlists/2', data=req,
+                           headers={'Token': other_token})
+        assert res.status_code == 400
+
+    def test_bucketlists_page_loads_items_in_one_query(self):
+        self.reg_user()
+        token = self.login_user()
+        for name in ('Before the end of the Year', 'Before the end of May'):
+            self.app.post(self.bucketlist_url,
+                          data={'name': name}, headers={'Token': token})
+        for bucketlist_id in (1, 2):
+            self.app.post(
+                '/api/v1/bucketlists/{}/items/'.format(bucketlist_id),
+                data={'name': 'Learn to Swim {}'.format(bucketlist_id)},
+                headers={'Token': token})
+        statements = []
+
+        def count_item_queries(conn, cursor, statement, *args):
+            if 'bucket_list_item.name' in statement:
+                statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', count_item_queries)
+        try:
+            res = self.app.get(
+                self.bucketlist_url, headers={'Token': token})
+        finally:
+            event.remove(
+                db.engine, 'before_cursor_execute', count_item_queries)
+        data = json.loads(res.data).get('data')
+        assert res.status_code == 200
+        assert len(data['Bucketlist1']['items']) == 1
+        assert len(data['Bucketlist2']['items']) == 1
+        assert len(statements) == 1
+
 
 class BucketListItemResource(TestCase):
     '''
@@ -242,7 +346,350 @@ class BucketListItemResource(TestCase):
                               headers={'Token': self.token})
         assert res.status_code == 200
 
+    def test_search_bucketlists_by_item_name(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        self.app.post('/api/v1/bucketlists/',
+                      data={'name': 'Things to learn'},
+                      headers={'Token': self.token})
+        self.app.post('/api/v1/bucketlists/2/items/',
+                      data={'name': 'Scuba diving lessons'},
+                      headers={'Token': self.token})
+        res = self.app.get('/api/v1/bucketlists/?q=scuba',
+                           headers={'Token': self.token})
+        assert res.status_code == 200
+        assert list(json.loads(res.data)['data']) == ['Bucketlist2']
+        res = self.app.get('/api/v1/bucketlists/?q=year',
+                           headers={'Token': self.token})
+        assert list(json.loads(res.data)['data']) == ['Bucketlist1']
+        self.app.delete('/api/v1/bucketlists/1',
+                        headers={'Token': self.token})
+        res = self.app.get('/api/v1/bucketlists/?q=year',
+                           headers={'Token': self.token})
+        assert res.status_code == 404
+
+    def test_batch_create_and_update_items(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        self.app.post(self.item_url, data={'name': 'Learn Python'},
+                      headers={'Token': self.token})
+        batch = {'items': [
+            {'name': 'Learn JavaScript'},
+            {'name': 'Learn Python'},
+            {'name': 'short'},
+            {'id': 1, 'done': True},
+            {'id': 9, 'name': 'Learn Haskell'},
+            {'name': 'Learn JavaScript'}]}
+        res = self.app.post(
+            '/api/v1/bucketlists/1/items/batch', data=json.dumps(batch),
+            content_type='application/json', headers={'Token': self.token})
+        assert res.status_code == 200
+        results = json.loads(res.data)['results']
+        assert [result['status'] for result in results] == [
+            201, 400, 400, 200, 404, 400]
+        assert results[0]['item']['name'] == 'Learn Javascript'
+        assert results[3]['item']['done'] == 'True'
+        assert BucketListItem.query.count() == 2
+        res = self.app.post(
+            '/api/v1/bucketlists/2/items/batch', data=json.dumps(batch),
+            content_type='application/json', headers={'Token': self.token})
+        assert res.status_code == 404
+
+    def test_conditional_get_bucketlist(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        for url in ('/api/v1/bucketlists/1', '/api/v1/bucketlists/'):
+            res = self.app.get(url, headers={'Token': self.token})
+            etag = res.headers['ETag']
+            res = self.app.get(url, headers={
+                'Token': self.token, 'If-None-Match': etag})
+            assert res.status_code == 304
+            assert not res.data
+            self.app.post(self.item_url, data={'name': 'Learn Python ' + url},
+                          headers={'Token': self.token})
+            res = self.app.get(url, headers={
+                'Token': self.token, 'If-None-Match': etag})
+            assert res.status_code == 200
+            assert res.headers['ETag'] != etag
+
+    def test_export_bucketlists_as_ndjson(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        self.app.post('/api/v1/bucketlists/', data={'name': 'Things to learn'},
+                      headers={'Token': self.token})
+        for name in ('Learn Python', 'Learn JavaScript'):
+            self.app.post(self.item_url, data={'name': name},
+                          headers={'Token': self.token})
+        res = self.app.get('/api/v1/bucketlists/export',
+                           headers={'Token': self.token})
+        assert res.status_code == 200
+        assert res.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in res.data.splitlines()]
+        assert [line['name'] for line in lines] == [
+            'Before The End Of The Year', 'Things To Learn']
+        assert lines[0] == json.loads(self.app.get(
+            '/api/v1/bucketlists/1', headers={'Token': self.token}).data)
+        assert lines[1]['items'] == []
+
+    def test_item_update_query_budget(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        self.app.post(self.item_url, data={'name': 'Learn Python'},
+                      headers={'Token': self.token})
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement.split()[0])
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            res = self.app.put('/api/v1/bucketlists/1/items/1',
+                               data={'name': 'Learn Python 3', 'done': True},
+                               headers={'Token': self.token})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert res.status_code == 201
+        assert json.loads(res.data)['done'] == 'True'
+        # the item, then the version of its bucketlist
+        assert statements == ['SELECT', 'UPDATE', 'UPDATE', 'SELECT']
+
+    def test_etag_changes_within_the_same_second(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        self.app.post(self.item_url, data={'name': 'Learn Python'},
+                      headers={'Token': self.token})
+        for url in ('/api/v1/bucketlists/1', '/api/v1/bucketlists/'):
+            etag = self.app.get(url, headers={'Token': self.token}).headers[
+                'ETag']
+            self.app.put(self.item_url + '1', data={'name': url + ' Python'},
+                         headers={'Token': self.token})
+            res = self.app.get(url, headers={'Token': self.token,
+                                             'If-None-Match': etag})
+            assert res.status_code == 200
+            assert res.headers['ETag'] != etag
+
+    def test_compiled_serializers_match_the_columns(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        self.app.post(self.item_url, data={'name': 'Learn Python'},
+                      headers={'Token': self.token})
+        item = BucketListItem.query.get(1)
+        assert item.as_dict() == {
+            column.name: str(getattr(item, column.name))
+            for column in item.__table__.columns
+            if column.name != 'bucketlist_id'}
+        res = self.app.get('/api/v1/bucketlists/1',
+                           headers={'Token': self.token})
+        assert list(json.loads(res.data)) == [
+            'id', 'name', 'items', 'date_created', 'date_modified',
+            'created_by']
+        app.config['RESTFUL_JSON'] = {'indent': 2}
+        try:
+            res = self.app.get('/api/v1/bucketlists/1',
+                               headers={'Token': self.token})
+        finally:
+            app.config.pop('RESTFUL_JSON')
+        assert res.data.startswith(b'{\n  "id"')
+
+    def test_deleted_bucketlists_reclaimed_in_batches(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        for name in ('Learn Python', 'Learn Golang', 'Learn Erlang'):
+            self.app.post(self.item_url, data={'name': name},
+                          headers={'Token': self.token})
+        res = self.app.delete('/api/v1/bucketlists/1',
+                              headers={'Token': self.token})
+        assert res.status_code == 200
+        res = self.app.get('/api/v1/bucketlists/1',
+                           headers={'Token': self.token})
+        assert res.status_code == 404
+        res = self.app.delete('/api/v1/bucketlists/1',
+                              headers={'Token': self.token})
+        assert res.status_code == 404
+        # the name is free again before the old list is purged
+        res = self.app.post('/api/v1/bucketlists/', data=self.bucketlist,
+                            headers={'Token': self.token})
+        assert res.status_code == 201
+        assert BucketListItem.query.count() == 3
+        assert reclaim_deleted(batch_size=2, max_batches=1) == {
+            'items': 2, 'bucketlists': 0}
+        assert reclaim_deleted(batch_size=2) == {
+            'items': 1, 'bucketlists': 1}
+        assert BucketListItem.query.count() == 0
+        assert [bucketlist.id for bucketlist in BucketList.query] == [2]
+        # items the hard deletes of older versions left without a list
+        with db.engine.connect() as connection:
+            connection.execute('PRAGMA foreign_keys=OFF')
+            connection.execute(
+                "INSERT INTO bucket_list_item (name, bucketlist_id) "
+                "VALUES ('Orphaned Python', 99)")
+            connection.execute('PRAGMA foreign_keys=ON')
+        assert reclaim_deleted() == {'items': 1, 'bucketlists': 0}
+        assert BucketListItem.query.count() == 0
+
+    def test_bulk_item_operations(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        for name in ('Learn Python', 'Learn Golang', 'Visit Nairobi'):
+            self.app.post(self.item_url, data={'name': name},
+                          headers={'Token': self.token})
+        statements = []
 
+        def record(conn, cursor, statement, *args):
+            statements.append(statement.split()[0])
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            res = self.app.patch(self.item_url + '?prefix=learn',
+                                 data={'done': 'true'},
+                                 headers={'Token': self.token})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert json.loads(res.data) == {'updated': 2}
+        assert statements == ['UPDATE', 'UPDATE']
+        res = self.app.patch(self.item_url + '?ids=1,2,3',
+                             data={'done': 'true'},
+                             headers={'Token': self.token})
+        assert json.loads(res.data) == {'updated': 1}
+        res = self.app.patch(self.item_url + '?prefix=Learn',
+                             data={'rename_prefix': 'Master'},
+                             headers={'Token': self.token})
+        assert json.loads(res.data) == {'updated': 2}
+        assert BucketListItem.query.get(1).name == 'Master Python'
+        res = self.app.patch(self.item_url + '?prefix=Master',
+                             data={'rename_prefix': 'M'},
+                             headers={'Token': self.token})
+        assert res.status_code == 400
+        res = self.app.patch(self.item_url, data={'rename_prefix': 'Do'},
+                             headers={'Token': self.token})
+        assert res.status_code == 400
+        res = self.app.delete(self.item_url + '?done=true&prefix=master',
+                              headers={'Token': self.token})
+        assert json.loads(res.data) == {'deleted': 2}
+        assert [item.name for item in BucketListItem.query] == [
+            'Visit Nairobi']
+        res = self.app.delete('/api/v1/bucketlists/2/items/?done=true',
+                              headers={'Token': self.token})
+        assert res.status_code == 404
 
+    def test_bulk_done_change_with_done_filter(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        for name in ('Learn Python', 'Learn Golang', 'Visit Nairobi'):
+            self.app.post(self.item_url, data={'name': name},
+                          headers={'Token': self.token})
+        self.app.put(self.item_url + '1', data={'done': 'True'},
+                     headers={'Token': self.token})
+        res = self.app.patch(self.item_url + '?done=false',
+                             data={'done': 'true'},
+                             headers={'Token': self.token})
+        assert json.loads(res.data) == {'updated': 2}
+        assert BucketListItem.query.filter_by(done=True).count() == 3
+        res = self.app.patch(self.item_url + '?done=true',
+                             data={'done': 'false'},
+                             headers={'Token': self.token})
+        assert json.loads(res.data) == {'updated': 3}
+        assert BucketListItem.query.filter_by(done=True).count() == 0
+
+    def test_item_pages_and_include_items(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        for name in ('Learn Python', 'Learn Golang', 'Visit Nairobi'):
+            self.app.post(self.item_url, data={'name': name},
+                          headers={'Token': self.token})
+        self.app.put(self.item_url + '2', data={'done': 'true'},
+                     headers={'Token': self.token})
+        res = self.app.get(self.item_url + '?limit=2',
+                           headers={'Token': self.token})
+        page = json.loads(res.data)
+        assert [item['id'] for item in page['data']] == ['1', '2']
+        res = self.app.get(page['next_page'], headers={'Token': self.token})
+        page = json.loads(res.data)
+        assert [item['id'] for item in page['data']] == ['3']
+        assert page['next_cursor'] is None
+        res = self.app.get(self.item_url + '?done=false&prefix=learn',
+                           headers={'Token': self.token})
+        assert [item['name'] for item in json.loads(res.data)['data']] == [
+            'Learn Python']
+        res = self.app.get(self.item_url + '3', headers={'Token': self.token})
+        assert json.loads(res.data)['name'] == 'Visit Nairobi'
+        res = self.app.get('/api/v1/bucketlists/2/items/',
+                           headers={'Token': self.token})
+        assert res.status_code == 404
+        for limit in ('0', '-1', '-3'):
+            res = self.app.get(self.item_url + '?limit=' + limit,
+                               headers={'Token': self.token})
+            assert res.status_code == 400
+        res = self.app.get('/api/v1/bucketlists/1?include_items=first:2',
+                           headers={'Token': self.token})
+        assert len(json.loads(res.data)['items']) == 2
+        res = self.app.get('/api/v1/bucketlists/1?include_items=count',
+                           headers={'Token': self.token})
+        assert json.loads(res.data)['items_count'] == 3
+        statements = []
 
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            res = self.app.get('/api/v1/bucketlists?include_items=false',
+                               headers={'Token': self.token})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert 'items' not in json.loads(res.data)['data']['Bucketlist1']
+        assert not any('bucket_list_item.name' in statement
+                       for statement in statements)
+        res = self.app.get('/api/v1/bucketlists/1?include_items=first',
+                           headers={'Token': self.token})
+        assert res.status_code == 400
+
+    def test_sparse_fieldsets_select_only_their_columns(self):
+        self.reg_user()
+        self.login_user()
+        self.post_bucketlist()
+        self.app.post(self.item_url, data={'name': 'Learn Python'},
+                      headers={'Token': self.token})
+        statements = []
 
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            res = self.app.get(
+                '/api/v1/bucketlists?fields=name,items.name',
+                headers={'Token': self.token})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert json.loads(res.data)['data'] == {
+            'Bucketlist1': {'name': 'Before The End Of The Year',
+                            'items': [{'name': 'Learn Python'}]}}
+        loads = [' '.join(statement.split('FROM')[0].split())
+                 for statement in statements
+                 if statement.startswith('SELECT bucket_list')]
+        assert loads == [
+            'SELECT bucket_list.id AS bucket_list_id, '
+            'bucket_list.name AS bucket_list_name',
+            'SELECT bucket_list_item.name AS bucket_list_item_name, '
+            'bucket_list_item.bucketlist_id AS bucket_list_item_bucketlist_id']
+        res = self.app.get('/api/v1/bucketlists/1?fields=id,created_by',
+                           headers={'Token': self.token})
+        assert json.loads(res.data) == {'id': '1', 'created_by': '1'}
+        res = self.app.get(self.item_url + '1?fields=done',
+                           headers={'Token': self.token})
+        assert json.loads(res.data) == {'done': 'False'}
+        res = self.app.get(self.item_url + '?fields=name,id',
+                           headers={'Token': self.token})
+        assert json.loads(res.data)['data'] == [
+            {'id': '1', 'name': 'Learn Python'}]
+        res = self.app.get('/api/v1/bucketlists/1?fields=password',
+                           headers={'Token': self.token})
+        assert res.status_code == 400
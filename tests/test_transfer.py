@@ -0,0 +1,97 @@
+import json
+from flask_testing import TestCase
+
+from tests import app, db, BucketList, BucketListItem
+from bucketlist_api.seed import seed_database
+from bucketlist_api.transfer import import_bucketlists
+
+
+class TestImportBucketlists(TestCase):
+    '''
+    NDJSON exports can be imported back in chunks
+    '''
+
+    def create_app(self):
+        app.config.from_object('config.TestingConfig')
+        return app
+
+    def setUp(self):
+        self.app = self.create_app().test_client()
+        db.drop_all()
+        db.create_all()
+        self.token = self.register_and_login('marcus')
+        self.register_and_login('aurelius')
+
+    def tearDown(self):
+        db.session.remove()
+
+    def test_import_export_round_trip(self):
+        lines = [json.dumps({'name': 'Before I Am {}'.format(age),
+                             'created_by': '1',
+                             'items': [
+                                 {'name': 'Visit Rome Italy', 'done': 'True'},
+                                 {'name': 'Learn Italian'}]})
+                 for age in range(30, 35)]
+        lines[2] = '{"name": "Broken'
+        lines.append(json.dumps({'name': 'Without An Owner'}))
+        reports = []
+        bucketlists, items, errors = import_bucketlists(
+            lines, chunk_size=2, progress=lambda *report: reports.append(
+                report))
+        assert (bucketlists, items) == (4, 8)
+        assert errors == [(3, 'invalid json'),
+                          (6, 'created_by is required without an owner')]
+        assert reports[-1] == (6, 4, 8)
+        assert BucketList.query.count() == 4
+        assert BucketListItem.query.filter_by(done=True).count() == 4
+        exported = self.app.get('/api/v1/bucketlists/export', headers={
+            'Token': self.token}).data.splitlines()
+        bucketlists, items, errors = import_bucketlists(exported, owner=2)
+        assert (bucketlists, items, errors) == (4, 8, [])
+        assert BucketList.query.filter_by(created_by=2).count() == 4
+
+    def test_import_normalises_names_and_skips_conflicts(self):
+        self.app.post('/api/v1/bucketlists/', data={'name': 'Before I Am 30'},
+                      headers={'Token': self.token})
+        lines = [json.dumps({'name': name, 'created_by': '1',
+                             'items': [{'name': 'learn italian'}]})
+                 for name in ('before i am 30', 'before i am 40', 'too short',
+                              'BEFORE I AM 40', 'before i am 50')]
+        lines.append(json.dumps({'name': 'before i am 60', 'created_by': '1',
+                                 'items': [{'name': 'Visit Rome'}]}))
+        lines.append(json.dumps({
+            'name': 'before i am 70', 'created_by': '1',
+            'items': [{'name': 'Learn Italian'}, {'name': 'learn italian'}]}))
+        bucketlists, items, errors = import_bucketlists(lines, chunk_size=10)
+        assert (bucketlists, items) == (2, 2)
+        assert errors == [
+            (3, 'bucketlist name must be at least 10 characters'),
+            (6, 'item names must be at least 11 characters'),
+            (7, 'item names must be unique in a bucketlist'),
+            (1, 'bucketlist name already exists'),
+            (4, 'bucketlist name already exists')]
+        assert sorted(name for name, in db.session.query(
+            BucketList.name)) == [
+            'Before I Am 30', 'Before I Am 40', 'Before I Am 50']
+        assert {name for name, in db.session.query(
+            BucketListItem.name)} == {'Learn Italian'}
+
+    def test_seed_is_deterministic(self):
+        assert seed_database(3, 4, 5, seed=7, chunk_size=5) == (3, 12, 60)
+        names = [name for name, in db.session.query(
+            BucketListItem.name).order_by(BucketListItem.id)]
+        with self.assertRaises(ValueError):
+            seed_database(3, 4, 5, seed=7)
+        seed_database(3, 4, 5, seed=7, prefix='again')
+        again = [name for name, in db.session.query(
+            BucketListItem.name).order_by(BucketListItem.id)][60:]
+        assert names == again
+        user = {'username': 'seed2', 'password': 'password'}
+        assert self.app.post('/api/v1/auth/login',
+                             data=user).status_code == 200
+
+    def register_and_login(self, username):
+        user = {'username': username, 'password': 'polymath'}
+        self.app.post('/api/v1/auth/register', data=user)
+        return json.loads(self.app.post(
+            '/api/v1/auth/login', data=user).data).get('token')